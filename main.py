@@ -11,36 +11,52 @@ import os
 import sys
 import time
 import tempfile
+import errno
 import shutil
+import subprocess
 import logging
-import json
+import functools
+import itertools
+import threading
+import concurrent.futures
+from dataclasses import dataclass, field, fields
+from collections import deque
+import atexit
+import gzip
+import hashlib
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, parse_qsl, urlencode, urlsplit, urlunsplit
 from datetime import datetime, timedelta
 
 # Core async libraries
 import httpx
-import aiohttp
-from aiofiles import open as aopen
-import nest_asyncio
+import orjson
+import aiofiles.os
+try:
+    import uvloop  # Faster event loop where available (not on Windows)
+except ImportError:
+    uvloop = None
+try:
+    import brotli  # Optional: smaller downloader page for browsers that accept br
+except ImportError:
+    brotli = None
 
 # URL validation and parsing
 import re
 import urllib.parse
-import validators
-import tldextract
-import rfc3987
+import urllib.request
 
 # ===== Telegram imports (real if available, else mock) =====
 try:
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Bot, Update
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Bot, Update, InputFile
     from telegram.ext import (
         Application, CommandHandler, MessageHandler,
         CallbackQueryHandler, ContextTypes, filters
     )
     from telegram.constants import ParseMode
     from telegram.error import TelegramError
+    from telegram.helpers import escape_markdown
     TELEGRAM_AVAILABLE = True
 except Exception:
     TELEGRAM_AVAILABLE = False
@@ -48,12 +64,13 @@ except Exception:
     class MockTelegram:
         def __init__(self, *args, **kwargs): pass
         def __call__(self, *args, **kwargs): return self
-        def __getattr__(self, name): return MockTelegram()
+        def __getattr__(self, name): return self  # Reuse this instance rather than allocating one per lookup
 
     InlineKeyboardButton = MockTelegram
     InlineKeyboardMarkup = MockTelegram
     Bot = MockTelegram
     Update = MockTelegram
+    InputFile = MockTelegram
     Application = MockTelegram
     CommandHandler = MockTelegram
     MessageHandler = MockTelegram
@@ -63,42 +80,49 @@ except Exception:
     ParseMode = MockTelegram()
     TelegramError = Exception
 
-# Video downloaders and processors
-import yt_dlp
-from instaloader import Instaloader
-from instagrapi import Client as InstaClient
-import moviepy.editor as mp
-from moviepy.video.io.VideoFileClip import VideoFileClip
+    def escape_markdown(text: str, version: int = 1, entity_type: Optional[str] = None) -> str:
+        return re.sub(r'([_*\[\]()~`>#+\-=|{}.!\\])', r'\\\1', text)
 
-# Web scraping and automation
-from playwright.async_api import async_playwright
-import cloudscraper
-from bs4 import BeautifulSoup
+# Video downloaders and processors are imported on first use: yt-dlp probes run in-process (see _yt_dlp), downloads via its CLI
 
 # Utilities
 from tqdm.asyncio import tqdm
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from cachetools import TTLCache
 from loguru import logger
-import m3u8
 from dotenv import load_dotenv
 
-# Flask web server
-from flask import Flask, jsonify, render_template_string, request, session, redirect, url_for
-from werkzeug.middleware.proxy_fix import ProxyFix
-import threading
+# Async web server (Quart on Hypercorn shares the bot's event loop)
+from quart import Quart, Response, request
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HypercornConfig
+from hypercorn.middleware import ProxyFixMiddleware
 import uuid
 
 # Load environment variables
 load_dotenv()
 
-# URL validation regex as requested
+# URL validation regex as requested; possessive quantifiers (Python 3.11+) never backtrack,
+# so matching stays linear on long or adversarial pasted text
 url_regex = re.compile(
     r'https?://'  # http:// or https://
-    r'[\w\-.]+' # domain name (letters, digits, -, .)
-    r'(?::\d+)?' # optional port, like :8080
-    r'(?:/[^\s<>"\')}]*)?'  # path and query string, avoids ending punctuation
+    r'[\w\-.]++' # domain name (letters, digits, -, .)
+    r'(?::\d++)?+' # optional port, like :8080
+    r'(?:/[^\s<>"\')}]*+)?+'  # path and query string, avoids ending punctuation
 )
 
+# Patterns used on every incoming message, compiled once at import
+url_scheme_regex = re.compile(r'^https?://', re.IGNORECASE)
+youtube_id_path_regex = re.compile(r'^/[a-zA-Z0-9_-]{11}')  # Bare YouTube video ID path
+instagram_shortcode_regex = re.compile(r'/(?:p|reel)/([A-Za-z0-9_-]+)')
+whitespace_regex = re.compile(r'\s+')
+_INVALID_FILENAME_CHARS = str.maketrans('', '', '<>:"/\\|?*')  # Characters invalid in filenames, deleted by translate
+direct_video_regex = re.compile(r'\.(?:mp4|mkv|avi|webm|mov)(?:[?#&/]|$)')  # Direct file link, extension ends a path segment
+
+def is_valid_url(u: str) -> bool:
+    """Single compiled-regex check for incoming links; the length cap rejects oversized payloads early"""
+    return len(u) < 2048 and bool(url_regex.fullmatch(u))
+
 # Verify bot token is loaded
 if not os.getenv("TELEGRAM_BOT_TOKEN"):
     logger.error("❌ TELEGRAM_BOT_TOKEN not found in environment!")
@@ -106,9 +130,6 @@ if not os.getenv("TELEGRAM_BOT_TOKEN"):
 else:
     logger.info("✅ Bot token loaded successfully")
 
-# Enable nested async loops
-nest_asyncio.apply()
-
 # Configure logging with error handling
 logger.remove()
 try:
@@ -116,6 +137,7 @@ try:
         sys.stdout, 
         level="INFO", 
         format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
+        enqueue=True,  # Written by loguru's worker thread, not the event loop
         catch=True,
         backtrace=False,
         diagnose=False
@@ -124,8 +146,10 @@ try:
         "bot.log", 
         rotation="10 MB", 
         retention="7 days",
+        compression="gz",
         level="INFO",
         format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
+        enqueue=True,
         catch=True,
         backtrace=False,
         diagnose=False
@@ -136,68 +160,894 @@ except Exception as e:
     logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
     print(f"Loguru setup failed, using basic logging: {e}")
 
-class Config:
-    """Configuration management"""
+@dataclass(frozen=True, slots=True)
+class BotConfig:
+    """Configuration management, read from the environment once at startup and frozen"""
     # Telegram settings
-    TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
-    TELEGRAM_CHAT_ID = int(os.getenv("TELEGRAM_CHAT_ID", "0"))
-    TELEGRAM_CHANNEL_ID = int(os.getenv("TELEGRAM_CHANNEL_ID", "0"))
-    FOLLOWING_CHANNEL = os.getenv("FOLLOWING_CHANNEL", "@allinonemaker")
-    DEVELOPER_CREDIT = "@Alcboss112"  # Developer attribution as requested
+    TELEGRAM_BOT_TOKEN: str = ""
+    TELEGRAM_CHAT_ID: int = 0
+    TELEGRAM_CHANNEL_ID: int = 0
+    FOLLOWING_CHANNEL: str = "@allinonemaker"
+    DEVELOPER_CREDIT: str = field(default="@Alcboss112", metadata={"env": False})  # Developer attribution as requested
 
     # API endpoints
-    TIKTOK_API = os.getenv("TIKTOK_API", "https://www.tikwm.com/api/?url=")
-    FACEBOOK_API = os.getenv("FACEBOOK_API", "https://myapi-2f5b.onrender.com/fbvideo/search?url=")
-    TWITTER_API = os.getenv("TWITTER_API", "https://twitsave.com/info?url=")
+    TIKTOK_API: str = "https://www.tikwm.com/api/?url="
+    FACEBOOK_API: str = "https://myapi-2f5b.onrender.com/fbvideo/search?url="
+    TWITTER_API: str = "https://twitsave.com/info?url="
 
     # Authentication - All cookies from .env file
-    INSTAGRAM_SESSIONID = os.getenv("INSTAGRAM_SESSIONID", "")
-    INSTAGRAM_CSRF_TOKEN = os.getenv("INSTAGRAM_CSRF_TOKEN", "")
+    INSTAGRAM_SESSIONID: str = ""
+    INSTAGRAM_CSRF_TOKEN: str = ""
 
     # Twitter cookies for enhanced functionality
-    TWITTER_AUTH_TOKEN = os.getenv("TWITTER_AUTH_TOKEN", "")
-    TWITTER_CT0 = os.getenv("TWITTER_CT0", "")
-    TWITTER_TWID = os.getenv("TWITTER_TWID", "")
-    TWITTER_GUEST_ID = os.getenv("TWITTER_GUEST_ID", "")
-    TWITTER_CF_CLEARANCE = os.getenv("TWITTER_CF_CLEARANCE", "")
-    TWITTER_CUID = os.getenv("TWITTER_CUID", "")
+    TWITTER_AUTH_TOKEN: str = ""
+    TWITTER_CT0: str = ""
+    TWITTER_TWID: str = ""
+    TWITTER_GUEST_ID: str = ""
+    TWITTER_CF_CLEARANCE: str = ""
+    TWITTER_CUID: str = ""
 
     # Facebook cookies for better access
-    FACEBOOK_CUSER = os.getenv("FACEBOOK_CUSER", "")
-    FACEBOOK_XS = os.getenv("FACEBOOK_XS", "")
-    FACEBOOK_FR = os.getenv("FACEBOOK_FR", "")
-    FACEBOOK_DATR = os.getenv("FACEBOOK_DATR", "")
+    FACEBOOK_CUSER: str = ""
+    FACEBOOK_XS: str = ""
+    FACEBOOK_FR: str = ""
+    FACEBOOK_DATR: str = ""
 
     # YouTube cookies for enhanced access
-    YOUTUBE_SAPISID = os.getenv("YOUTUBE_SAPISID", "")
-    YOUTUBE_SECURE_3PSID = os.getenv("YOUTUBE_SECURE_3PSID", "")
-    YOUTUBE_APISID = os.getenv("YOUTUBE_APISID", "")
-    YOUTUBE_SID = os.getenv("YOUTUBE_SID", "")
+    YOUTUBE_SAPISID: str = ""
+    YOUTUBE_SECURE_3PSID: str = ""
+    YOUTUBE_APISID: str = ""
+    YOUTUBE_SID: str = ""
 
-    TELEGRAM_API_ID = int(os.getenv("TELEGRAM_API_ID", "0"))
-    TELEGRAM_API_HASH = os.getenv("TELEGRAM_API_HASH", "")
+    TELEGRAM_API_ID: int = 0
+    TELEGRAM_API_HASH: str = ""
 
     # Settings
-    AUTO_CLEANUP_HOURS = int(os.getenv("AUTO_CLEANUP_HOURS", "12"))
-    PORT = int(os.getenv("PORT", "5000"))
-    MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB (Telegram's limit for bots)
-    MAX_VIDEO_SIZE = 2 * 1024 * 1024 * 1024  # 2GB max for full HD videos
+    AUTO_CLEANUP_HOURS: int = 12
+    PORT: int = 5000
+    MAX_FILE_SIZE: int = field(default=50 * 1024 * 1024, metadata={"env": False})  # 50MB (Telegram's limit for bots)
+    MAX_VIDEO_SIZE: int = field(default=2 * 1024 * 1024 * 1024, metadata={"env": False})  # 2GB max for full HD videos
+    DL_WORKERS: int = 8  # Threads for blocking downloader calls
+    DL_CONCURRENCY: int = 4  # Downloads allowed to run at once to start with
+    DL_CONCURRENCY_MAX: int = 16  # Ceiling the adaptive download limit may climb to
+    ANALYSIS_TTL: int = 3600  # Seconds a web video analysis stays cached
+    POLL_TIMEOUT: int = 30  # Seconds getUpdates long-polls before returning
+    WEBHOOK_URL: str = ""  # Public base URL; enables webhook mode instead of polling
+    WEBHOOK_SECRET: str = ""  # Optional secret Telegram echoes back on each webhook call
+    TMPFS_MIN_FREE: int = 8 * 1024 * 1024 * 1024  # Bytes /dev/shm needs free to hold temp files; 0 always uses it
+    WEB_RATE_LIMIT: int = 6  # Web downloads a client IP may start per minute; 0 disables the limit
+
+    def __post_init__(self):
+        for name in ("DL_WORKERS", "DL_CONCURRENCY"):
+            if getattr(self, name) < 1:
+                raise ValueError(f"{name} must be at least 1")
+        if self.DL_CONCURRENCY_MAX < self.DL_CONCURRENCY:
+            raise ValueError("DL_CONCURRENCY_MAX must be at least DL_CONCURRENCY")
+
+    @classmethod
+    def from_env(cls) -> "BotConfig":
+        """Build the config from environment variables named after each field"""
+        values = {}
+        for config_field in fields(cls):
+            raw = os.getenv(config_field.name)
+            if raw is None or not config_field.metadata.get("env", True):
+                continue
+            values[config_field.name] = int(raw) if config_field.type is int else raw
+        return cls(**values)
+
+Config = BotConfig.from_env()
 
 # Global variables
 user_states = {}
 download_stats = {"total_users": 0, "total_downloads": 0}
 bot_status = {"running": False, "last_update": None, "bot_instance": None}
 
-# Flask server setup
-app = Flask(__name__)
+# Shared worker pool so blocking downloader calls (yt-dlp, instaloader) never stall the event loop
+DOWNLOAD_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=Config.DL_WORKERS,
+    thread_name_prefix="downloader"
+)
+
+class AdaptiveSemaphore:
+    """Semaphore whose capacity hill-climbs on measured aggregate throughput.
+
+    Every `interval` seconds the bytes reported by running downloads are turned into a rate. While all slots are
+    busy, a rate that grew by 10% since the last step earns another slot and a rate that fell gives one back;
+    past a handful of flows the extra connections only contend with each other. Only some transfers report bytes
+    (yt-dlp CLI runs and ffmpeg don't), so a falling rate is weak evidence: the limit never drops below `value`.
+    """
+    def __init__(self, value: int, maximum: int, interval: float = 5.0):
+        self.limit = value
+        self.minimum = value
+        self.maximum = maximum
+        self.interval = interval
+        self._active = 0
+        self._waiters: deque = deque()
+        self._bytes = 0
+        self._last_rate = 0.0
+        self._tuner: Optional[asyncio.Task] = None
+
+    def locked(self) -> bool:
+        return self._active >= self.limit
+
+    async def acquire(self):
+        if self._tuner is None:
+            self._tuner = asyncio.create_task(self._tune_loop())
+        while self._active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # We were handed a slot we'll never use; pass it on
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._active += 1
+
+    def release(self):
+        self._active -= 1
+        self._wake()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def _wake(self):
+        free = self.limit - self._active
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def count_bytes(self, delta: int):
+        """Add bytes a download received since its last progress tick"""
+        if delta > 0:
+            self._bytes += delta
+
+    async def _tune_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            rate = self._bytes / self.interval
+            self._bytes = 0
+            if self._active < self.limit:
+                # Demand, not the limit, is what bounds throughput right now
+                self._last_rate = rate
+                continue
+            if rate > 0 and rate >= self._last_rate * 1.1 and self.limit < self.maximum:
+                self.limit += 1
+                self._wake()
+                logger.info(f"Download limit raised to {self.limit} ({rate / 1024 / 1024:.1f} MB/s)")
+            elif rate < self._last_rate * 0.9 and self.limit > self.minimum:
+                self.limit -= 1
+                logger.info(f"Download limit lowered to {self.limit} ({rate / 1024 / 1024:.1f} MB/s)")
+            self._last_rate = rate
+
+# Caps simultaneous downloads so disk and memory stay bounded at N x video size; N follows measured throughput
+DOWNLOAD_SEMAPHORE = AdaptiveSemaphore(Config.DL_CONCURRENCY, Config.DL_CONCURRENCY_MAX)
+
+def pick_temp_root() -> str:
+    """/dev/shm when it can hold several full-size downloads at once, so download, compress and upload skip the disk"""
+    try:
+        shm = os.statvfs('/dev/shm')
+    except OSError:
+        return tempfile.gettempdir()
+    if shm.f_bavail * shm.f_frsize >= Config.TMPFS_MIN_FREE and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+TEMP_ROOT = pick_temp_root()
+
+# Direct links at least this large are split into byte ranges fetched over parallel connections
+RANGE_DOWNLOAD_MIN_SIZE = 8 * 1024 * 1024
+RANGE_DOWNLOAD_CONNECTIONS = 8
+# Single-stream downloads gather socket reads into writes of this size
+STREAM_WRITE_SIZE = 4 * 1024 * 1024
+# Smallest slice worth its own connection; below this the extra handshake costs more than it wins
+RANGE_DOWNLOAD_MIN_PART = 4 * 1024 * 1024
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the download executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DOWNLOAD_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+# The loop only keeps weak references to tasks, so fire-and-forget work is held here until it finishes
+_background_tasks: set = set()
+
+def spawn(coro) -> asyncio.Task:
+    """Schedule a coroutine on the running loop without letting it be garbage-collected mid-flight"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def run_process(cmd: List[str], timeout: float) -> subprocess.CompletedProcess:
+    """Run a command as an asyncio subprocess instead of parking a thread in subprocess.run.
+
+    stdout stays bytes for the JSON parsers; stderr is decoded (tail only) when the command fails.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(cmd, timeout) from None
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    stderr_text = stderr[-4000:].decode(errors='replace') if proc.returncode else ''
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr_text)
+
+# Extensions yt-dlp may leave a finished video under; .part, .info.json and thumbnails fall through
+_VIDEO_EXTS = frozenset(('.mp4', '.mkv', '.webm', '.avi'))
+_MEDIA_EXTS = _VIDEO_EXTS | {'.mp3'}
+
+def iter_video_files(directory: str, exts=_VIDEO_EXTS):
+    """Yield (path, size) for each non-empty file in directory with one of exts, from one scandir pass; DirEntry caches the stat"""
+    with os.scandir(directory) as it:
+        for entry in it:
+            if os.path.splitext(entry.name)[1] in exts and entry.is_file():
+                size = entry.stat().st_size
+                if size > 0:
+                    yield Path(entry.path), size
+
+async def probe_media(path: str) -> Optional[Dict]:
+    """ffprobe's stream and container description of a file, or None when it can't be read"""
+    result = await run_process(
+        ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', '-show_format', path],
+        timeout=30
+    )
+    if result.returncode != 0:
+        return None
+    try:
+        return orjson.loads(result.stdout)
+    except orjson.JSONDecodeError:
+        return None
+
+# yt-dlp prints one machine-readable line per progress tick instead of rendering its progress bar
+YTDLP_PROGRESS_ARGS = [
+    '--newline',
+    '--progress-template',
+    'download:DL:%(progress.downloaded_bytes)s/%(progress.total_bytes,progress.total_bytes_estimate)s',
+]
+
+async def run_streaming(cmd: List[str], timeout: float, on_line) -> subprocess.CompletedProcess:
+    """run_process variant that hands each stdout line to an async callback as it arrives instead of buffering it"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=1 << 20
+    )
+    stderr_task = asyncio.ensure_future(proc.stderr.read())
+
+    async def pump():
+        async for line in proc.stdout:
+            await on_line(line)
+        await proc.wait()
+
+    try:
+        await asyncio.wait_for(pump(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(cmd, timeout) from None
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    stderr = await stderr_task
+    stderr_text = stderr[-4000:].decode(errors='replace') if proc.returncode else ''
+    return subprocess.CompletedProcess(cmd, proc.returncode, b'', stderr_text)
+
+async def run_ytdlp(cmd: List[str], timeout: float, progress_tracker) -> subprocess.CompletedProcess:
+    """run_streaming for a yt-dlp download using YTDLP_PROGRESS_ARGS, forwarding each progress line to the tracker"""
+    async def on_line(line: bytes):
+        if not line.startswith(b'DL:'):
+            return
+        done, _, total = line[3:].strip().partition(b'/')
+        try:
+            current = int(float(done))
+        except ValueError:
+            return  # NA until the first bytes arrive
+        try:
+            total_bytes = int(float(total))
+        except ValueError:
+            total_bytes = 0
+        await progress_tracker.update_progress(current, total_bytes or current, stage="Downloading")
+
+    return await run_streaming(cmd, timeout, on_line)
+
+def ffmpeg_progress_reporter(progress_tracker, stage: str, duration: float):
+    """on_line callback for `ffmpeg -progress pipe:1` that reports each further 10% of `duration` encoded"""
+    duration_us = duration * 1_000_000
+    reported = 0
+
+    async def on_line(line: bytes):
+        nonlocal reported
+        if not line.startswith(b'out_time_us='):
+            return
+        try:
+            done = int(line[12:])
+        except ValueError:
+            return  # N/A before the first frame is written
+        percent = min(90, int(done * 100 / duration_us) // 10 * 10)
+        if percent > reported:
+            reported = percent
+            await progress_tracker.update_compression_progress(stage, f"{percent}% encoded")
+
+    return on_line
+
+async def first_json_line(cmd: List[str], timeout: float) -> Dict:
+    """Parse a `yt-dlp --dump-json` style command's stdout as it streams and stop the child at the first JSON object.
+
+    Raises with the command's stderr when it exits without printing one.
+    """
+    # An info line runs to megabytes, so the reader limit is raised well past asyncio's 64 KiB default
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=16 << 20
+    )
+    stderr_task = asyncio.ensure_future(proc.stderr.read())
+
+    async def first_info() -> Optional[Dict]:
+        async for raw in proc.stdout:
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                return orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                continue
+        return None
+
+    try:
+        info = await asyncio.wait_for(first_info(), timeout=timeout)
+    finally:
+        # Done with its output, timed out, or cancelled because the caller no longer needs it
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+    if not info:
+        stderr = await stderr_task
+        raise Exception(f"Info extraction failed: {stderr[-4000:].decode(errors='replace') or 'no video info found'}")
+    stderr_task.cancel()
+    return info
+
+def stat_size(path: str) -> int:
+    """Size of a file from a single stat, 0 when it doesn't exist"""
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+def allocate(fd: int, size: int):
+    """Size a file to `size` bytes as real, ideally contiguous, blocks; a sparse truncate where fallocate is unavailable"""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    os.ftruncate(fd, size)
+
+def urllib_download(url: str, dest: str, headers: Dict[str, str], total_size: int, report,
+                    stop: threading.Event) -> int:
+    """Blocking single-stream download over urllib, reading into one reused buffer; returns the bytes written.
+
+    report(done, total) is called after every STREAM_WRITE_SIZE block. A known total_size is preallocated.
+    Setting `stop` ends the transfer after the current socket read, since a thread can't be cancelled.
+    """
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=300) as response:
+        if not total_size:
+            total_size = int(response.headers.get('Content-Length') or 0)
+        if total_size > 0:
+            logger.info(f"Downloading direct file: {total_size/1024/1024:.1f} MB")
+
+        fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if total_size > 0:
+                # Reserve the whole file up front, then write into it in place
+                allocate(fd, total_size)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        buf = memoryview(bytearray(STREAM_WRITE_SIZE))
+        downloaded = 0
+        # Wrapping the fd keeps the preallocation; nothing reopens or truncates the file
+        with open(fd, 'wb') as f:
+            while True:
+                filled = 0
+                while filled < len(buf):
+                    if stop.is_set():
+                        return downloaded
+                    n = response.readinto(buf[filled:])
+                    if not n:
+                        break
+                    filled += n
+                if not filled:
+                    break
+                f.write(buf[:filled])
+                downloaded += filled
+                report(downloaded, total_size)
+            # Content-Length can overstate what the server actually sent
+            f.truncate(downloaded)
+    return downloaded
+
+async def load_input_file(file_path: str) -> InputFile:
+    """Read a file for upload on the executor so large videos don't block the event loop.
+
+    PTB can't stream an upload: InputFile holds the whole file in memory until the request is sent. Files over
+    MAX_FILE_SIZE are refused before reading, since the Bot API would reject them anyway and each read would
+    otherwise pin up to MAX_VIDEO_SIZE per concurrent upload.
+    """
+    def _load():
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > Config.MAX_FILE_SIZE:
+                raise ValueError(f"{format_bytes(size)} is over the {format_bytes(Config.MAX_FILE_SIZE)} upload limit")
+            return InputFile(f, filename=os.path.basename(file_path))
+
+    return await run_blocking(_load)
+
+# Hardware encoders in preference order; HEVC gives markedly smaller files than H.264 at the same quality
+_HW_ENCODERS = ('hevc_nvenc', 'hevc_qsv', 'hevc_videotoolbox', 'h264_nvenc')
+
+@functools.lru_cache(maxsize=1)
+def has_cuda_hwaccel() -> bool:
+    """Whether ffmpeg can decode on CUDA, letting NVENC jobs keep frames in VRAM end-to-end"""
+    try:
+        hwaccels = subprocess.run(['ffmpeg', '-hide_banner', '-hwaccels'], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return 'cuda' in hwaccels.split()
+
+@functools.lru_cache(maxsize=1)
+def select_hwenc() -> Optional[str]:
+    """Probe ffmpeg once for the first hardware video encoder that actually works on this host"""
+    try:
+        encoders = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=10).stdout
+        for encoder in _HW_ENCODERS:
+            if encoder not in encoders:
+                continue
+            # Builds list hardware encoders even without the device, so encode a few blank frames to be sure
+            test = subprocess.run(
+                ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1',
+                 '-c:v', encoder, '-f', 'null', '-'],
+                capture_output=True, timeout=20
+            )
+            if test.returncode == 0:
+                logger.info(f"ffmpeg hardware encoding: {encoder}")
+                return encoder
+    except (OSError, subprocess.SubprocessError):
+        pass
+    logger.info("ffmpeg hardware encoding unavailable, using libx264")
+    return None
+
+# Never read stdin, and only print errors so the captured stderr tail is the failure, not the banner and stats
+FFMPEG = ['ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error']
+# Encodes allowed at once; each gets an even share of the cores instead of x264's all-cores default,
+# so concurrent compressions don't oversubscribe the CPU
+COMPRESS_SLOTS = max(1, (os.cpu_count() or 4) // 4)
+COMPRESS_SEM = asyncio.Semaphore(COMPRESS_SLOTS)
+_FFMPEG_THREADS = str(max(2, min(8, (os.cpu_count() or 4) // COMPRESS_SLOTS)))
+
+def ffmpeg_encode_cmd(src: str, dst: str, *, crf: str, preset: str, audio_bitrate: str,
+                      height: Optional[int] = None, maxrate: Optional[str] = None,
+                      encoder: Optional[str] = None) -> List[str]:
+    """Build a video/AAC re-encode command for a hardware encoder, or libx264 when encoder is None"""
+    scale = 'scale'
+    if encoder and encoder.endswith('_nvenc') and has_cuda_hwaccel():
+        # Decode, scale and encode all on the GPU
+        cmd = [*FFMPEG, '-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda', '-i', src]
+        scale = 'scale_cuda'
+    else:
+        cmd = [*FFMPEG, '-i', src]
+    if height:
+        cmd += ['-vf', f"{scale}=-2:{height}"]
+    cmd += _video_codec_args(encoder, crf, preset, maxrate)
+    cmd += ['-c:a', 'aac', '-b:a', audio_bitrate, '-movflags', '+faststart', '-y', dst]
+    return cmd
+
+def _video_codec_args(encoder: Optional[str], crf: str, preset: str, maxrate: Optional[str]) -> List[str]:
+    """Encoder-specific rate control for one output"""
+    if encoder is None:
+        args = ['-c:v', 'libx264', '-preset', preset, '-crf', crf, '-pix_fmt', 'yuv420p', '-threads', _FFMPEG_THREADS]
+    elif encoder.endswith('_nvenc'):
+        args = ['-c:v', encoder, '-preset', 'p4', '-tune', 'hq', '-rc', 'vbr', '-cq', crf,
+                '-spatial-aq', '1', '-aq-strength', '8']
+    elif encoder == 'hevc_qsv':
+        args = ['-c:v', encoder, '-preset', 'faster', '-global_quality', crf]
+    else:
+        # VideoToolbox has no constant-quality mode on every Mac, so it targets a bitrate
+        args = ['-c:v', encoder, '-b:v', maxrate or '2000k']
+    if encoder and encoder.startswith('hevc'):
+        args += ['-tag:v', 'hvc1']  # Lets Apple players and Telegram's iOS client play HEVC in MP4
+    if maxrate:
+        args += ['-maxrate', maxrate, '-bufsize', str(int(maxrate[:-1]) * 2) + 'k']
+    return args
+
+def ffmpeg_ladder_cmd(src: str, levels: List[Dict[str, str]], outputs: List[str],
+                      encoder: Optional[str] = None) -> List[str]:
+    """One decode split into a scaled output per level, instead of re-decoding the source per resolution"""
+    labels = [f"v{i}" for i in range(len(levels))]
+    graph = f"[0:v]split={len(levels)}" + ''.join(f"[{label}]" for label in labels)
+    for label, level in zip(labels, levels):
+        graph += f";[{label}]scale=-2:{level['height']}[o{label}]"
+    cmd = [*FFMPEG, '-i', src, '-filter_complex', graph]
+    for label, level, dst in zip(labels, levels, outputs):
+        cmd += ['-map', f"[o{label}]", '-map', '0:a?']
+        cmd += _video_codec_args(encoder, level['crf'], level['preset'], level['bitrate'])
+        cmd += ['-c:a', 'aac', '-b:a', level['audio'], '-movflags', '+faststart', '-y', dst]
+    return cmd
+
+async def ffmpeg_encode(timeout: int, build=ffmpeg_encode_cmd, on_progress=None, **cmd_kwargs) -> subprocess.CompletedProcess:
+    """Run a re-encode on the hardware encoder when present, falling back to libx264 if it fails.
+
+    on_progress, when given, receives ffmpeg's `-progress` key=value lines as the encode runs.
+    """
+    # The first call probes the encoders (and CUDA decode, which build() consults for NVENC); keep that off
+    # the loop, later calls hit the cache
+    hwenc = await asyncio.to_thread(select_hwenc)
+    if hwenc and hwenc.endswith('_nvenc'):
+        await asyncio.to_thread(has_cuda_hwaccel)
+    result = None
+    async with COMPRESS_SEM:
+        for encoder in ((hwenc, None) if hwenc else (None,)):
+            cmd = build(encoder=encoder, **cmd_kwargs)
+            if on_progress:
+                cmd[1:1] = ['-progress', 'pipe:1', '-nostats']
+                result = await run_streaming(cmd, timeout, on_progress)
+            else:
+                result = await run_process(cmd, timeout=timeout)
+            if result.returncode == 0:
+                break
+            if encoder:
+                # Hardware decoders don't cover every source codec; retry the same job on the CPU
+                logger.warning(f"{encoder} encode failed, retrying with libx264: {result.stderr[-300:]}")
+    return result
+
+@functools.lru_cache(maxsize=1)
+def _yt_dlp():
+    """Import yt-dlp on the first probe; its extractor registry is heavy and most commands never need it"""
+    import yt_dlp
+    return yt_dlp
+
+# One YoutubeDL per worker thread: the instance isn't thread-safe, but reusing it keeps extractors and HTTP pools warm
+_ydl_local = threading.local()
+YDL_PROBE_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'nocheckcertificate': True,
+    'socket_timeout': 45,
+    'http_headers': {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'},
+}
+
+def extract_video_info(url: str) -> Optional[Dict]:
+    """Blocking yt-dlp metadata probe, the in-process equivalent of `yt-dlp --dump-json`"""
+    ydl = getattr(_ydl_local, 'ydl', None)
+    if ydl is None:
+        ydl = _ydl_local.ydl = _yt_dlp().YoutubeDL(YDL_PROBE_OPTS)
+    info = ydl.extract_info(url, download=False)
+    return ydl.sanitize_info(info) if info else None
+
+class AsyncTTLCache:
+    """TTLCache whose misses are computed once; concurrent callers for a key await the same in-flight task"""
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[Any, asyncio.Future] = {}
+
+    async def get_or_compute(self, key, compute):
+        """Return the cached value, or run compute() once for every caller waiting on this key"""
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._settle, key))
+        # A cancelled waiter must not cancel the probe the others are sharing
+        return await asyncio.shield(task)
+
+    def _settle(self, key, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        # Only successful results are kept, so a failed probe is retried on the next request
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._cache[key] = task.result()
+
+# Height thresholds for the quality labels shown to users, highest first
+QUALITY_TIERS = ((2160, '4K'), (1440, '1440p'), (1080, '1080p'), (720, '720p'), (480, '480p'), (360, '360p'))
+INV_MB = 1.0 / (1024 * 1024)
+
+# yt-dlp format selectors and display names for the quality choices offered by the bot and the web page
+_QUALITY_MAP = {
+    "4k": "best[height<=2160][ext=mp4]/bestvideo[height<=2160][ext=mp4]+bestaudio[ext=m4a]/best[height<=2160]",
+    "1440p": "best[height<=1440][ext=mp4]/bestvideo[height<=1440][ext=mp4]+bestaudio[ext=m4a]/best[height<=1440]",
+    "1080p": "best[height<=1080][ext=mp4]/bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080]",
+    "720p": "best[height<=720][ext=mp4]/bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720]",
+    "480p": "best[height<=480][ext=mp4]/bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480]",
+    "360p": "best[height<=360][ext=mp4]/bestvideo[height<=360][ext=mp4]+bestaudio[ext=m4a]/best[height<=360]",
+    "audio": "bestaudio[ext=m4a]/bestaudio[ext=mp3]/bestaudio/best"
+}
+_QUALITY_NAMES = {
+    "4k": "4K Ultra HD",
+    "1440p": "1440p QHD",
+    "1080p": "1080p Full HD",
+    "720p": "720p HD",
+    "480p": "480p Standard",
+    "360p": "360p Compact",
+    "audio": "MP3 Audio Only"
+}
+
+# yt-dlp metadata per URL; the bot probes a link when it arrives and again when a quality is picked
+VIDEO_INFO_CACHE = AsyncTTLCache(maxsize=512, ttl=300)
+
+# One pooled HTTP client shared by every downloader so connections and TLS sessions are reused
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=120.0,
+            http2=True,  # Multiplex API calls to the same host over one connection
+            # httpx drops idle connections after 5 s by default; API hosts are hit minutes apart, so keep them warm
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=300)
+        )
+    return _http_client
+
+async def close_http_client():
+    """Close the shared HTTP client on shutdown"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# Registrable domains mapped to the platform handlers that know how to download them
+_PLATFORM_BY_HOST = {
+    'youtube.com': 'youtube', 'youtu.be': 'youtube', 'youtube-nocookie.com': 'youtube',
+    'twitter.com': 'twitter', 'x.com': 'twitter',
+    'facebook.com': 'facebook', 'fb.com': 'facebook', 'fb.watch': 'facebook',
+    'tiktok.com': 'tiktok',
+    'instagram.com': 'instagram', 'instagr.am': 'instagram',
+}
+
+@functools.lru_cache(maxsize=1024)
+def platform_for_host(host: str) -> Optional[str]:
+    """Resolve a hostname to its platform by walking up its parent domains"""
+    host = host.lower()
+    while host:
+        platform = _PLATFORM_BY_HOST.get(host)
+        if platform:
+            return platform
+        host = host.partition('.')[2]
+    return None
+
+# Cookie files are built from static .env values, so each platform's file is written once per process
+COOKIE_DIR = tempfile.mkdtemp(prefix="cookies_", dir=TEMP_ROOT)
+atexit.register(shutil.rmtree, COOKIE_DIR, True)
+_cookie_files: Dict[str, str] = {}
+
+# Configured cookies per platform, resolved once; unset values are left out
+_COOKIES_BY_PLATFORM: Dict[str, Dict[str, str]] = {
+    platform: {name: value for name, value in pairs if value}
+    for platform, pairs in {
+        'instagram': (('sessionid', Config.INSTAGRAM_SESSIONID), ('csrftoken', Config.INSTAGRAM_CSRF_TOKEN)),
+        'facebook': (('c_user', Config.FACEBOOK_CUSER), ('xs', Config.FACEBOOK_XS),
+                     ('fr', Config.FACEBOOK_FR), ('datr', Config.FACEBOOK_DATR)),
+        'twitter': (('auth_token', Config.TWITTER_AUTH_TOKEN), ('ct0', Config.TWITTER_CT0),
+                    ('twid', Config.TWITTER_TWID), ('guest_id', Config.TWITTER_GUEST_ID),
+                    ('cf_clearance', Config.TWITTER_CF_CLEARANCE), ('_cuid', Config.TWITTER_CUID)),
+        'youtube': (('SAPISID', Config.YOUTUBE_SAPISID), ('__Secure-3PSID', Config.YOUTUBE_SECURE_3PSID),
+                    ('APISID', Config.YOUTUBE_APISID), ('SID', Config.YOUTUBE_SID)),
+    }.items()
+}
+
+_NETSCAPE_HEADER = b"# Netscape HTTP Cookie File\n# This is a generated file!  Do not edit.\n\n"
+# Domains each platform's cookies are sent to; X serves the same session under both names
+_COOKIE_DOMAINS = {
+    'instagram': (b'.instagram.com',),
+    'facebook': (b'.facebook.com',),
+    'twitter': (b'.twitter.com', b'.x.com'),
+    'youtube': (b'.youtube.com',),
+}
+
+def get_cookie_file(platform: str, cookies: Dict[str, str]) -> str:
+    """Return the Netscape cookie file for a platform, writing it on first use"""
+    cookie_file = _cookie_files.get(platform)
+    if cookie_file:
+        return cookie_file
+
+    cookie_file = os.path.join(COOKIE_DIR, f"{platform}_cookies.txt")
+    blob = _NETSCAPE_HEADER + b"".join(
+        b"\t".join((domain, b"TRUE", b"/", b"TRUE", b"2147483647", name.encode(), value.encode())) + b"\n"
+        for domain in _COOKIE_DOMAINS.get(platform, ())
+        for name, value in cookies.items()
+    )
+    # Session cookies are credentials: owner-only, written in a single call and renamed into place
+    tmp_file = cookie_file + ".tmp"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, blob)
+    finally:
+        os.close(fd)
+    os.replace(tmp_file, cookie_file)
+
+    _cookie_files[platform] = cookie_file
+    return cookie_file
+
+# Quart server setup
+app = Quart(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+app.asgi_app = ProxyFixMiddleware(app.asgi_app, mode="legacy", trusted_hops=1)
+
+def ojsonify(obj) -> Response:
+    """JSON response via orjson; non-serializable values such as the bot handle fall back to str()"""
+    return Response(orjson.dumps(obj, default=str), content_type='application/json')
+
+async def read_json() -> Dict:
+    """Request body parsed with orjson; an empty dict when it's missing or not a JSON object"""
+    try:
+        data = orjson.loads(await request.get_data())
+    except orjson.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+_BYTE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+def format_bytes(bytes_num: float) -> str:
+    """Format bytes to human readable format; the unit comes from the bit length, no divide loop"""
+    i = min(4, max(0, (int(bytes_num).bit_length() - 1) // 10))
+    return f"{bytes_num / (1 << (10 * i)):.1f} {_BYTE_UNITS[i]}"
+
+# Per-client token buckets for /download as (tokens, last refill); idle clients age out of the cache
+_download_buckets: TTLCache = TTLCache(maxsize=10_000, ttl=600)
+
+def allow_download(client: str) -> bool:
+    """Take a token from the client's bucket, refilled at WEB_RATE_LIMIT per minute up to a burst of the same size"""
+    now = time.monotonic()
+    capacity = Config.WEB_RATE_LIMIT
+    tokens, last = _download_buckets.get(client, (capacity, now))
+    tokens = min(capacity, tokens + (now - last) * capacity / 60)
+    allowed = tokens >= 1
+    _download_buckets[client] = (tokens - 1 if allowed else tokens, now)
+    return allowed
+
+@dataclass(slots=True)
+class DownloadState:
+    """Progress of one web-interface download, pushed to /progress/<id>/events and readable at /progress/<id>"""
+    progress: int = 0
+    status: str = 'Starting download...'
+    completed: bool = False
+    error: Optional[str] = None
+    result: Optional[Dict] = None
+    title: str = ''
+    description: str = ''
+    downloaded: int = 0
+    total: int = 0
+    reported_speed: str = ''
+    # (bytes_done, monotonic time) ring; speed is derived only when /progress is read
+    samples: deque = field(default_factory=lambda: deque(maxlen=16))
+    # Replaced on every notify(), so each listener wakes once per change without clearing it for the others
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def notify(self):
+        """Wake every progress stream waiting on this download"""
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def update(self, **changes):
+        """Apply status fields and push them to listeners"""
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.notify()
+
+    def record(self, current: int, total: int, stage: str, speed: str = ""):
+        """Store a progress tick without any formatting work"""
+        DOWNLOAD_SEMAPHORE.count_bytes(current - self.downloaded)
+        self.downloaded = current
+        self.total = total
+        self.status = stage
+        self.reported_speed = speed
+        self.progress = max(20, min(int(current * 100 / total) if total > 0 else 0, 100))  # Minimum 20% to show progress
+        self.samples.append((current, time.monotonic()))
+        self.notify()
+
+    def speed(self) -> float:
+        """Bytes per second across the buffered samples"""
+        if len(self.samples) < 2:
+            return 0.0
+        (first_bytes, first_time), (last_bytes, last_time) = self.samples[0], self.samples[-1]
+        elapsed = last_time - first_time
+        return (last_bytes - first_bytes) / elapsed if elapsed > 0 else 0.0
+
+    def size_info(self) -> str:
+        if not self.total and not self.downloaded:
+            return ''
+        size_info = f"{format_bytes(self.downloaded)} / {format_bytes(self.total)}"
+        bytes_per_sec = self.speed()
+        if bytes_per_sec > 0:
+            size_info += f" • {format_bytes(bytes_per_sec)}/s"
+        elif self.reported_speed:
+            size_info += f" • {self.reported_speed}"
+        return size_info
+
+    def to_dict(self) -> Dict:
+        return {
+            'progress': self.progress,
+            'status': self.status,
+            'completed': self.completed,
+            'error': self.error,
+            'result': self.result,
+            'size_info': self.size_info(),
+            'title': self.title,
+            'description': self.description
+        }
+
+class _NoopTracker:
+    """Progress sink for downloads nobody watches; stands in wherever a ProgressTracker is expected"""
+    async def update_progress(self, current: int, total: int, speed: str = "", stage: str = "Downloading"):
+        pass
+
+    async def update_compression_progress(self, stage: str, details: str = ""):
+        pass
+
+_NOOP_TRACKER = _NoopTracker()
+
+class CallbackTracker(_NoopTracker):
+    """Tracker that hands each download tick to an async callback"""
+    def __init__(self, callback):
+        self.callback = callback
+
+    async def update_progress(self, current: int, total: int, speed: str = "", stage: str = "Downloading"):
+        await self.callback(current, total, speed, stage)
+
+class WebProgressTracker(_NoopTracker):
+    """Tracker that records download ticks on a web download's state"""
+    def __init__(self, state: DownloadState):
+        self.state = state
+
+    async def update_progress(self, current: int, total: int, speed: str = "", stage: str = "Downloading"):
+        # Cheap enough to take every tick; /progress formats the latest sample on demand
+        self.state.record(current, total, stage, speed)
 
-# Global variable to store download progress
-download_progress = {}
+# Web download progress. In-flight jobs stay in a plain dict however long they queue or run; on completion the state
+# moves to a TTL cache, so the outcome stays readable for an hour and finished jobs don't pile up
+download_progress: Dict[str, DownloadState] = {}
+finished_downloads: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
 
-# Video analysis cache for previews and quality detection
-video_analysis_cache = {}
+def get_download_state(download_id: str) -> Optional[DownloadState]:
+    state = download_progress.get(download_id)
+    return state if state is not None else finished_downloads.get(download_id)
+
+# Video analysis cache for previews and quality detection, keyed by canonical_url()
+video_analysis_cache = TTLCache(maxsize=4096, ttl=Config.ANALYSIS_TTL)
+
+def canonical_url(url: str) -> str:
+    """Normalize a URL so scheme/host case, query order and trailing slashes share one cache entry"""
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), query, ''))
 
 # HTML template for the downloader web interface
 DOWNLOADER_PAGE_TEMPLATE = """
@@ -619,8 +1469,8 @@ DOWNLOADER_PAGE_TEMPLATE = """
                 const data = await response.json();
                 
                 if (data.success) {
-                    // Poll for progress
-                    pollProgress(data.download_id);
+                    // Follow progress over server-sent events
+                    watchProgress(data.download_id);
                 } else {
                     showError(data.error || 'Download failed');
                 }
@@ -629,25 +1479,23 @@ DOWNLOADER_PAGE_TEMPLATE = """
             }
         });
 
-        function pollProgress(downloadId) {
-            const interval = setInterval(async () => {
-                try {
-                    const response = await fetch('/progress/' + downloadId);
-                    const data = await response.json();
-                    
-                    updateProgress(data.progress, data.status, data.size_info);
-                    
-                    if (data.completed) {
-                        clearInterval(interval);
-                        showResult(data.result);
-                    } else if (data.error) {
-                        clearInterval(interval);
-                        showError(data.error);
-                    }
-                } catch (error) {
-                    console.error('Progress polling error:', error);
+        function watchProgress(downloadId) {
+            const source = new EventSource('/progress/' + downloadId + '/events');
+            source.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+                
+                updateProgress(data.progress, data.status, data.size_info);
+                
+                if (data.error) {
+                    source.close();
+                    showError(data.error);
+                } else if (data.completed) {
+                    source.close();
+                    showResult(data.result);
                 }
-            }, 1000);
+            };
+            // EventSource reconnects on its own after dropped connections
+            source.onerror = () => console.error('Progress stream interrupted');
         }
 
         function updateProgress(progress, status, sizeInfo) {
@@ -691,15 +1539,39 @@ DOWNLOADER_PAGE_TEMPLATE = """
 </html>
 """
 
+# The page has no template variables, so strip indentation and compress it once instead of rendering per request
+DOWNLOADER_PAGE_BYTES = '\n'.join(
+    line.strip() for line in DOWNLOADER_PAGE_TEMPLATE.splitlines() if line.strip()
+).encode('utf-8')
+DOWNLOADER_PAGE_ETAG = hashlib.blake2b(DOWNLOADER_PAGE_BYTES, digest_size=16).hexdigest()
+DOWNLOADER_PAGE_ENCODED = {'gzip': gzip.compress(DOWNLOADER_PAGE_BYTES, 9)}
+if brotli:
+    DOWNLOADER_PAGE_ENCODED['br'] = brotli.compress(DOWNLOADER_PAGE_BYTES, quality=11)
+# Preferred first when the client accepts both
+DOWNLOADER_PAGE_ENCODINGS = sorted(DOWNLOADER_PAGE_ENCODED, key=lambda encoding: len(DOWNLOADER_PAGE_ENCODED[encoding]))
+
 @app.route('/')
-def index():
+async def index():
     """Main downloader web interface"""
-    return render_template_string(DOWNLOADER_PAGE_TEMPLATE)
+    encoding = request.accept_encodings.best_match(DOWNLOADER_PAGE_ENCODINGS)
+    etag = f"{DOWNLOADER_PAGE_ETAG}-{encoding}" if encoding else DOWNLOADER_PAGE_ETAG
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': 'public, max-age=3600',
+        'Vary': 'Accept-Encoding'
+    }
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        return Response(DOWNLOADER_PAGE_ENCODED[encoding], content_type='text/html; charset=utf-8', headers=headers)
+    return Response(DOWNLOADER_PAGE_BYTES, content_type='text/html; charset=utf-8', headers=headers)
 
 @app.route('/health')
-def health_check():
+async def health_check():
     """Health check endpoint for Render"""
-    return jsonify({
+    return ojsonify({
         "status": "healthy",
         "bot_running": bot_status["running"],
         "last_update": bot_status["last_update"],
@@ -708,20 +1580,20 @@ def health_check():
     })
 
 @app.route('/status')
-def status():
+async def status():
     """Status endpoint returning bot information"""
-    return jsonify({
+    return ojsonify({
         "bot_status": bot_status,
         "download_stats": download_stats,
         "timestamp": time.time()
     })
 
 @app.route('/wake')
-def wake():
+async def wake():
     """Wake endpoint to keep the service alive"""
     try:
         logger.info("Wake endpoint called - service is alive")
-        return jsonify({
+        return ojsonify({
             "message": "Service is awake",
             "bot_status": bot_status["running"],
             "timestamp": time.time(),
@@ -729,43 +1601,38 @@ def wake():
         })
     except Exception as e:
         logger.error(f"Wake endpoint error: {e}")
-        return jsonify({
+        return ojsonify({
             "message": "Service is awake but encountered an error",
             "error": str(e),
             "timestamp": time.time()
         }), 500
 
 @app.route('/download', methods=['POST'])
-def web_download():
+async def web_download():
     """Handle download requests from web interface"""
     try:
-        data = request.get_json()
+        data = await read_json()
         url = data.get('url')
         quality = data.get('quality', '720p')
         format_type = data.get('format', 'mp4')
         
         if not url:
-            return jsonify({'success': False, 'error': 'URL is required'}), 400
+            return ojsonify({'success': False, 'error': 'URL is required'}), 400
+        if not isinstance(url, str) or not is_valid_url(url):
+            return ojsonify({'success': False, 'error': 'Invalid URL'}), 400
+        if Config.WEB_RATE_LIMIT and not allow_download(request.remote_addr or 'unknown'):
+            return ojsonify({'success': False, 'error': 'Too many downloads, please wait a minute'}), 429, {'Retry-After': '60'}
             
         # Generate download ID
         download_id = str(uuid.uuid4())
         
         # Initialize progress tracking
-        download_progress[download_id] = {
-            'progress': 0,
-            'status': 'Starting download...',
-            'completed': False,
-            'error': None,
-            'result': None,
-            'size_info': '',
-            'title': '',
-            'description': ''
-        }
+        download_progress[download_id] = DownloadState()
         
         # Start download in background
-        asyncio.create_task(process_web_download(download_id, url, quality, format_type))
+        spawn(process_web_download(download_id, url, quality, format_type))
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'download_id': download_id,
             'message': 'Download started'
@@ -773,68 +1640,115 @@ def web_download():
         
     except Exception as e:
         logger.error(f"Web download error: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/progress/<download_id>')
-def get_progress(download_id):
+async def get_progress(download_id):
     """Get download progress"""
     try:
-        if download_id not in download_progress:
-            return jsonify({'error': 'Download not found'}), 404
+        state = get_download_state(download_id)
+        if state is None:
+            return ojsonify({'error': 'Download not found'}), 404
             
-        progress_data = download_progress[download_id]
-        return jsonify(progress_data)
+        return ojsonify(state.to_dict())
         
     except Exception as e:
         logger.error(f"Progress check error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
+
+@app.route('/progress/<download_id>/events')
+async def stream_progress(download_id):
+    """Server-sent events for one download: a message per state change, a comment every 30s to keep the connection up"""
+    state = get_download_state(download_id)
+    if state is None:
+        return ojsonify({'error': 'Download not found'}), 404
+
+    async def events():
+        while True:
+            changed = state.changed
+            yield b"data: " + orjson.dumps(state.to_dict(), default=str) + b"\n\n"
+            if state.completed:
+                return
+            while True:
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=30)
+                    break
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+            # yt-dlp reports many times a second; fold a burst of ticks into one message
+            await asyncio.sleep(0.25)
+
+    response = Response(events(), content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None  # Lives as long as the download
+    return response
 
 @app.route('/analyze', methods=['POST'])
-def analyze_video():
+async def analyze_video():
     """Analyze video URL to get preview and quality options"""
     try:
-        data = request.get_json()
+        data = await read_json()
         url = data.get('url')
         
         if not url:
-            return jsonify({'success': False, 'error': 'URL is required'}), 400
-        
+            return ojsonify({'success': False, 'error': 'URL is required'}), 400
+        if not isinstance(url, str) or not is_valid_url(url):
+            return ojsonify({'success': False, 'error': 'Invalid URL'}), 400
+
+        # Reuse a recent successful analysis instead of probing the URL again
+        cached = video_analysis_cache.get(canonical_url(url))
+        if cached and cached.get('success'):
+            return ojsonify({
+                'success': True,
+                'message': 'Analysis cached'
+            })
+
         # Start analysis in background
-        asyncio.create_task(analyze_video_info(url))
+        spawn(analyze_video_info(url))
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'message': 'Analysis started'
         })
         
     except Exception as e:
         logger.error(f"Video analysis error: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/video_info/<path:encoded_url>')
-def get_video_info(encoded_url):
+async def get_video_info(encoded_url):
     """Get analyzed video information"""
     try:
         import urllib.parse
         url = urllib.parse.unquote(encoded_url)
         
         # Check if analysis is complete
-        if url in video_analysis_cache:
-            return jsonify(video_analysis_cache[url])
+        analysis = video_analysis_cache.get(canonical_url(url))
+        if analysis is not None:
+            return ojsonify(analysis)
         else:
-            return jsonify({'analyzing': True, 'message': 'Analysis in progress...'})
+            return ojsonify({'analyzing': True, 'message': 'Analysis in progress...'})
             
     except Exception as e:
         logger.error(f"Video info error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return ojsonify({'error': str(e)}), 500
 
-def run_flask_server():
-    """Run Flask server in a separate thread"""
+async def run_web_server():
+    """Serve the Quart app with Hypercorn on the running event loop"""
+    hypercorn_config = HypercornConfig()
+    hypercorn_config.bind = [f"0.0.0.0:{Config.PORT}"]
+    hypercorn_config.accesslog = None
     try:
-        logger.info(f"🌐 Starting Flask server on port {Config.PORT}")
-        app.run(host='0.0.0.0', port=Config.PORT, debug=False, use_reloader=False)
+        logger.info(f"🌐 Starting web server on port {Config.PORT}")
+        # Our own trigger keeps Hypercorn from taking over SIGINT/SIGTERM from asyncio.run
+        await serve(app, hypercorn_config, shutdown_trigger=asyncio.Event().wait)
     except Exception as e:
-        logger.error(f"Flask server error: {e}")
+        logger.error(f"Web server error: {e}")
+
+# Every bar the tracker can show, built once; index by percentage // 5
+_BARS = tuple("█" * i + "░" * (20 - i) for i in range(21))
+_STAGE_EMOJI = {'Downloading': '📥', 'Uploading': '📤', 'Processing': '🔄'}
 
 class ProgressTracker:
     """Enhanced progress tracker with speed monitoring"""
@@ -845,77 +1759,99 @@ class ProgressTracker:
         self.last_update = 0
         self.start_time = time.time()
         self.last_bytes = 0
-        self.speed_samples = []
+        self.speed_samples = deque(maxlen=5)  # Last 5 samples for smoothing
+        self.last_text = None  # Last text sent, so repeated stages don't cost an API call
+        # Download ticks only record the latest state; one flusher task turns it into at most one edit per interval
+        self.flush_interval = 1.2
+        self._latest: Optional[Tuple[int, int, str, str]] = None
+        self._dirty = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        # Bytes already fed to the download limiter; unlike _latest, stage changes and aclose leave it alone
+        self._counted_bytes = 0
+
+    async def _edit(self, text: str, **kwargs) -> bool:
+        """Edit the progress message, skipping no-op edits Telegram would reject as 'not modified'"""
+        if text == self.last_text:
+            return False
+        await self.bot.edit_message_text(
+            chat_id=self.chat_id,
+            message_id=self.message_id,
+            text=text,
+            **kwargs
+        )
+        self.last_text = text
+        return True
 
     async def update_progress(self, current: int, total: int, speed: str = "", stage: str = "Downloading"):
+        """Record the latest download state; the flusher task sends it to Telegram"""
+        if current < self._counted_bytes:
+            self._counted_bytes = 0  # Progress went backwards: a new transfer started
+        DOWNLOAD_SEMAPHORE.count_bytes(current - self._counted_bytes)
+        self._counted_bytes = current
+        self._latest = (current, total, speed, stage)
+        self._dirty.set()
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """Edit the message with whatever state is newest, then hold off for flush_interval; states in between are dropped"""
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            if self._latest is None:
+                continue
+            await self._send_progress(*self._latest)
+            await asyncio.sleep(self.flush_interval)
+
+    async def aclose(self):
+        """Stop the flusher so a late progress edit can't overwrite the message that follows the download"""
+        self._latest = None
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+    async def _send_progress(self, current: int, total: int, speed: str, stage: str):
         """Enhanced progress update with better speed calculation and ETA"""
         now = time.time()
-        if now - self.last_update < 1.2:  # Update every 1.2 seconds for smoother progress
-            return
-
         percentage = (current / total) * 100 if total > 0 else 0
-        progress_bar = "█" * int(percentage // 5) + "░" * (20 - int(percentage // 5))
+        progress_bar = _BARS[max(0, min(int(percentage // 5), 20))]
 
-        # Enhanced speed calculation
-        if not speed and current > self.last_bytes:
+        # Enhanced speed calculation; bytes/sec stays numeric for the ETA and is only formatted for display
+        avg_speed = 0.0
+        if current > self.last_bytes:
             elapsed = now - self.last_update if self.last_update > 0 else 1
-            bytes_per_sec = (current - self.last_bytes) / elapsed
-            self.speed_samples.append(bytes_per_sec)
-
-            # Keep only last 5 samples for smoothing
-            if len(self.speed_samples) > 5:
-                self.speed_samples.pop(0)
-
+            self.speed_samples.append((current - self.last_bytes) / elapsed)
             avg_speed = sum(self.speed_samples) / len(self.speed_samples)
-            if avg_speed > 1024 * 1024:  # > 1 MB/s
-                speed = f"{avg_speed/1024/1024:.1f} MB/s"
-            elif avg_speed > 1024:  # > 1 KB/s
-                speed = f"{avg_speed/1024:.0f} KB/s"
-            else:
-                speed = f"{avg_speed:.0f} B/s"
+            if not speed:
+                speed = f"{format_bytes(avg_speed)}/s"
 
         # Enhanced ETA calculation
         eta_str = ""
-        if total > current and speed:
-            try:
-                if "MB/s" in speed:
-                    speed_val = float(speed.split()[0])
-                    remaining_mb = (total - current) / (1024 * 1024)
-                    eta_seconds = remaining_mb / speed_val if speed_val > 0 else 0
-                elif "KB/s" in speed:
-                    speed_val = float(speed.split()[0])
-                    remaining_kb = (total - current) / 1024
-                    eta_seconds = remaining_kb / speed_val if speed_val > 0 else 0
-                else:
-                    eta_seconds = 0
-
-                if eta_seconds > 0:
-                    if eta_seconds > 60:
-                        eta_str = f" • ETA: {int(eta_seconds//60)}m {int(eta_seconds%60)}s"
-                    else:
-                        eta_str = f" • ETA: {int(eta_seconds)}s"
-            except:
-                pass
+        if total > current and avg_speed > 0:
+            eta_seconds = (total - current) / avg_speed
+            if eta_seconds > 60:
+                eta_str = f" • ETA: {int(eta_seconds//60)}m {int(eta_seconds%60)}s"
+            else:
+                eta_str = f" • ETA: {int(eta_seconds)}s"
 
-        # Enhanced progress text with emojis
-        emoji = {'Downloading': '📥', 'Uploading': '📤', 'Processing': '🔄'}.get(stage, '📊')
-        text = f"{emoji} **{stage}...**\n\n"
-        text += f"`{progress_bar}` {percentage:.1f}%\n"
-        text += f"📊 **Size:** {self._format_bytes(current)} / {self._format_bytes(total)}\n"
+        # Plain text: Telegram has nothing to parse on the most frequent edit, and titles can't break the markup
+        emoji = _STAGE_EMOJI.get(stage, '📊')
+        text = f"{emoji} {stage}...\n\n"
+        text += f"{progress_bar} {percentage:.1f}%\n"
+        text += f"📊 Size: {format_bytes(current)} / {format_bytes(total)}\n"
         if speed:
-            text += f"🚀 **Speed:** {speed}{eta_str}\n"
+            text += f"🚀 Speed: {speed}{eta_str}\n"
 
         # Add estimated completion time for large files
         if total > 50 * 1024 * 1024:  # Files larger than 50MB
-            text += f"⏱️ **Please wait, processing large file...**"
+            text += f"⏱️ Please wait, processing large file..."
 
         try:
-            await self.bot.edit_message_text(
-                chat_id=self.chat_id,
-                message_id=self.message_id,
-                text=text,
-                parse_mode='Markdown'
-            )
+            await self._edit(text)
             self.last_update = now
             self.last_bytes = current
         except Exception as e:
@@ -923,147 +1859,115 @@ class ProgressTracker:
 
     async def update_compression_progress(self, stage: str, details: str = ""):
         """Update progress for compression operations"""
+        self._latest = None  # Download ticks still queued are older than this stage
         text = f"🔄 **{stage}**\n\n"
         if details:
             text += f"{details}\n\n"
         text += f"⏱️ Please wait, this may take a few minutes..."
 
         try:
-            await self.bot.edit_message_text(
-                chat_id=self.chat_id,
-                message_id=self.message_id,
-                text=text,
-
-            )
+            await self._edit(text)
         except Exception as e:
             logger.warning(f"Failed to update compression progress: {e}")
 
-    @staticmethod
-    def _format_bytes(bytes_num: int) -> str:
-        """Format bytes to human readable format"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if bytes_num < 1024.0:
-                return f"{bytes_num:.1f} {unit}"
-            bytes_num /= 1024.0
-        return f"{bytes_num:.1f} TB"
-
 async def analyze_video_info(url: str):
     """Analyze video URL to extract preview and quality information"""
+    cache_key = canonical_url(url)
+    video_analysis_cache.pop(cache_key, None)
     try:
-        import urllib.parse
+        # Probing only reads metadata, so the shared downloader does; no temp dir per request
+        downloader = get_probe_downloader()
+        platform = downloader.get_platform(url)
         
-        async with SocialMediaDownloader() as downloader:
-            platform = await downloader.get_platform(url)
+        # Get comprehensive video information
+        video_info = await downloader._get_video_quality_info(url, platform)
+        
+        if video_info:
+            # Extract available qualities with file sizes
+            available_qualities = []
+            if 'video_formats' in video_info:
+                for fmt in video_info['video_formats']:
+                    quality = fmt.get('quality_level')
+                    filesize_mb = fmt.get('filesize_mb', 0)
+                    height = fmt.get('height', 0)
+                    if quality:
+                        available_qualities.append({
+                            'quality': quality,
+                            'height': height,
+                            'size_mb': filesize_mb,
+                            'size_text': f"{filesize_mb:.0f}MB" if filesize_mb > 0 else "Auto"
+                        })
             
-            # Get comprehensive video information
-            video_info = await downloader._get_video_quality_info(url, platform)
+            # Get thumbnail URL
+            thumbnail_url = video_info.get('thumbnail', '')
+            
+            # Store analysis result
+            video_analysis_cache[cache_key] = {
+                'success': True,
+                'title': video_info.get('title', 'Unknown Video'),
+                'description': video_info.get('description', '')[:200] + '...' if video_info.get('description', '') else '',
+                'uploader': video_info.get('uploader', video_info.get('channel', 'Unknown')),
+                'duration': video_info.get('duration', 0),
+                'view_count': video_info.get('view_count', 0),
+                'thumbnail': thumbnail_url,
+                'platform': platform.title(),
+                'available_qualities': available_qualities,
+                'has_audio': bool(video_info.get('audio_formats')),
+                'upload_date': video_info.get('upload_date', ''),
+            }
+        else:
+            video_analysis_cache[cache_key] = {
+                'success': False,
+                'error': 'Could not analyze video'
+            }
             
-            if video_info:
-                # Extract available qualities with file sizes
-                available_qualities = []
-                if 'video_formats' in video_info:
-                    for fmt in video_info['video_formats']:
-                        quality = fmt.get('quality_level')
-                        filesize_mb = fmt.get('filesize_mb', 0)
-                        height = fmt.get('height', 0)
-                        if quality:
-                            available_qualities.append({
-                                'quality': quality,
-                                'height': height,
-                                'size_mb': filesize_mb,
-                                'size_text': f"{filesize_mb:.0f}MB" if filesize_mb > 0 else "Auto"
-                            })
-                
-                # Get thumbnail URL
-                thumbnail_url = video_info.get('thumbnail', '')
-                
-                # Store analysis result
-                video_analysis_cache[url] = {
-                    'success': True,
-                    'title': video_info.get('title', 'Unknown Video'),
-                    'description': video_info.get('description', '')[:200] + '...' if video_info.get('description', '') else '',
-                    'uploader': video_info.get('uploader', video_info.get('channel', 'Unknown')),
-                    'duration': video_info.get('duration', 0),
-                    'view_count': video_info.get('view_count', 0),
-                    'thumbnail': thumbnail_url,
-                    'platform': platform.title(),
-                    'available_qualities': available_qualities,
-                    'has_audio': bool(video_info.get('audio_formats')),
-                    'upload_date': video_info.get('upload_date', ''),
-                }
-            else:
-                video_analysis_cache[url] = {
-                    'success': False,
-                    'error': 'Could not analyze video'
-                }
-                
     except Exception as e:
         logger.error(f"Video analysis failed: {e}")
-        video_analysis_cache[url] = {
+        video_analysis_cache[cache_key] = {
             'success': False,
             'error': str(e)
         }
 
 async def process_web_download(download_id: str, url: str, quality: str, format_type: str):
+    """Run a web download once one of the shared download slots is free"""
+    try:
+        if DOWNLOAD_SEMAPHORE.locked():
+            download_progress[download_id].update(status='Queued, waiting for a free download slot...')
+        async with DOWNLOAD_SEMAPHORE:
+            await _run_web_download(download_id, url, quality, format_type)
+    finally:
+        state = finished_downloads[download_id] = download_progress.pop(download_id)
+        if not state.completed:
+            # Cancelled (e.g. at shutdown) before reporting; let /progress and the event stream end
+            state.update(status='Cancelled', completed=True, error='Download cancelled')
+
+async def _run_web_download(download_id: str, url: str, quality: str, format_type: str):
     """Process download for web interface with enhanced progress tracking"""
+    state = download_progress[download_id]
     try:
         # Update status
-        download_progress[download_id]['status'] = 'Analyzing URL...'
-        download_progress[download_id]['progress'] = 5
+        state.update(status='Analyzing URL...', progress=5)
         
         async with SocialMediaDownloader() as downloader:
-            platform = await downloader.get_platform(url)
+            platform = downloader.get_platform(url)
             
             # Get video info first
-            download_progress[download_id]['status'] = 'Getting video information...'
-            download_progress[download_id]['progress'] = 15
+            state.update(status='Getting video information...', progress=15)
             
             # Extract title and description
             try:
                 video_info = await downloader._get_video_quality_info(url, platform)
                 if video_info and isinstance(video_info, dict):
-                    download_progress[download_id]['title'] = video_info.get('title', 'Unknown Title')
-                    download_progress[download_id]['description'] = video_info.get('description', '')[:200] + '...' if video_info.get('description', '') else ''
-            except:
-                download_progress[download_id]['title'] = 'Video Download'
-                download_progress[download_id]['description'] = ''
-            
-            # Create web progress tracker
-            class WebProgressTracker:
-                def __init__(self, download_id):
-                    self.download_id = download_id
-                    self.last_update = 0
-                
-                async def update_progress(self, current: int, total: int, speed: str = "", stage: str = "Downloading"):
-                    now = time.time()
-                    if now - self.last_update < 1:
-                        return
-                    
-                    percentage = min(int((current / total) * 100) if total > 0 else 0, 100)
-                    size_info = f"{self._format_bytes(current)} / {self._format_bytes(total)}"
-                    if speed:
-                        size_info += f" • {speed}"
-                    
-                    download_progress[self.download_id].update({
-                        'progress': max(20, percentage),  # Minimum 20% to show progress
-                        'status': stage,
-                        'size_info': size_info
-                    })
-                    self.last_update = now
-                
-                @staticmethod
-                def _format_bytes(bytes_num: int) -> str:
-                    for unit in ['B', 'KB', 'MB', 'GB']:
-                        if bytes_num < 1024.0:
-                            return f"{bytes_num:.1f} {unit}"
-                        bytes_num /= 1024.0
-                    return f"{bytes_num:.1f} TB"
+                    state.title = video_info.get('title', 'Unknown Title')
+                    state.description = video_info.get('description', '')[:200] + '...' if video_info.get('description', '') else ''
+            except Exception:
+                state.title = 'Video Download'
+                state.description = ''
             
-            progress_tracker = WebProgressTracker(download_id)
+            progress_tracker = WebProgressTracker(state)
             
             # Download the video with selected quality
-            download_progress[download_id]['status'] = f'Downloading {quality} {format_type.upper()}...'
-            download_progress[download_id]['progress'] = 25
+            state.update(status=f'Downloading {quality} {format_type.upper()}...', progress=25)
             
             # Enhanced download with proper quality selection
             result = await downloader.download_video_enhanced(
@@ -1075,215 +1979,167 @@ async def process_web_download(download_id: str, url: str, quality: str, format_
             
             if result.get('success'):
                 # Upload to private channel
-                download_progress[download_id]['status'] = 'Uploading to private channel...'
-                download_progress[download_id]['progress'] = 80
+                state.update(status='Uploading to private channel...', progress=80)
                 
                 # Send to private channel
                 if Config.TELEGRAM_CHANNEL_ID and bot_status.get("bot_instance"):
                     try:
                         bot = bot_status["bot_instance"]
                         
-                        # Prepare caption with title and description
-                        caption = f"🎬 **{download_progress[download_id]['title']}**\n"
-                        if download_progress[download_id]['description']:
-                            caption += f"\n📝 {download_progress[download_id]['description']}\n"
-                        caption += f"\n🎯 Quality: {quality} | Format: {format_type.upper()}"
-                        caption += f"\n📁 Size: {ProgressTracker._format_bytes(result.get('file_size', 0))}"
-                        caption += f"\n👨‍💻 Downloaded via Web Interface"
+                        # Prepare caption with title and description, escaped so any title renders under MarkdownV2
+                        esc = functools.partial(escape_markdown, version=2)
+                        caption = f"🎬 *{esc(state.title)}*\n"
+                        if state.description:
+                            caption += f"\n📝 {esc(state.description)}\n"
+                        caption += esc(f"\n🎯 Quality: {quality} | Format: {format_type.upper()}")
+                        caption += esc(f"\n📁 Size: {format_bytes(result.get('file_size', 0))}")
+                        caption += esc(f"\n👨‍💻 Downloaded via Web Interface")
                         
-                        with open(result['file_path'], 'rb') as video_file:
-                            await bot.send_video(
-                                chat_id=Config.TELEGRAM_CHANNEL_ID,
-                                video=video_file,
-                                caption=caption,
-                                parse_mode='Markdown',
-                                supports_streaming=True
-                            )
+                        await bot.send_video(
+                            chat_id=Config.TELEGRAM_CHANNEL_ID,
+                            video=await load_input_file(result['file_path']),
+                            caption=caption,
+                            parse_mode='MarkdownV2',
+                            supports_streaming=True
+                        )
                         
                         # Clean up file
                         try:
-                            os.unlink(result['file_path'])
-                        except:
+                            await aiofiles.os.remove(result['file_path'])
+                        except OSError:
                             pass
                             
                     except Exception as e:
                         logger.warning(f"Failed to send to private channel: {e}")
                 
                 # Mark as completed
-                download_progress[download_id].update({
-                    'progress': 100,
-                    'status': 'Download complete!',
-                    'completed': True,
-                    'result': {
-                        'message': f'Successfully downloaded {download_progress[download_id]["title"]} and sent to private channel.',
-                        'title': download_progress[download_id]['title'],
+                state.update(
+                    progress=100,
+                    status='Download complete!',
+                    completed=True,
+                    result={
+                        'message': f'Successfully downloaded {state.title} and sent to private channel.',
+                        'title': state.title,
                         'quality': quality,
                         'format': format_type,
-                        'size': ProgressTracker._format_bytes(result.get('file_size', 0))
+                        'size': format_bytes(result.get('file_size', 0))
                     }
-                })
+                )
                 
             else:
                 raise Exception(result.get('error', 'Download failed'))
                 
     except Exception as e:
         logger.error(f"Web download failed: {e}")
-        download_progress[download_id].update({
-            'progress': 0,
-            'status': 'Failed',
-            'completed': True,
-            'error': str(e)
-        })
+        state.update(progress=0, status='Failed', completed=True, error=str(e))
 
 class SocialMediaDownloader:
     """Enhanced downloader with faster compression and better progress tracking"""
 
     def __init__(self):
         self.session = None
-        self.playwright_browser = None
-        self.temp_dir = tempfile.mkdtemp(prefix="telegram_bot_")
+        self.temp_dir = tempfile.mkdtemp(prefix="telegram_bot_", dir=TEMP_ROOT)
+        self._file_seq = itertools.count()
+
+    def _download_dir(self) -> str:
+        """Fresh subdirectory for one yt-dlp run, so finding its output never trips over earlier attempts"""
+        return tempfile.mkdtemp(dir=self.temp_dir)
+
+    def _temp_path(self, stem: str, ext: str = ".mp4") -> str:
+        """Unique output path in this downloader's temp dir; timestamps collide within the same second"""
+        return os.path.join(self.temp_dir, f"{stem}_{next(self._file_seq)}{ext}")
 
     async def __aenter__(self):
-        self.session = httpx.AsyncClient(timeout=120.0)
+        self.session = get_http_client()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.aclose()
-        if self.playwright_browser:
-            await self.playwright_browser.close()
-        # Cleanup temp directory
-        try:
-            shutil.rmtree(self.temp_dir, ignore_errors=True)
-        except Exception:
-            pass
+        # The shared HTTP client outlives this downloader and is closed at shutdown
+        # Cleanup temp directory off the loop; a finished download can leave thousands of fragments behind
+        await asyncio.to_thread(shutil.rmtree, self.temp_dir, ignore_errors=True)
 
-    async def get_platform(self, url: str) -> str:
-        """Detect platform from URL with enhanced pattern matching"""
+    def get_platform(self, url: str) -> str:
+        """Detect platform from the URL's host, falling back to stream/file patterns"""
         url_lower = url.lower().strip()
+        if '://' not in url_lower:
+            url_lower = f"https://{url_lower}"
+
+        platform = platform_for_host(urlparse(url_lower).hostname or '')
+        if platform:
+            return platform
 
-        # Enhanced YouTube detection
-        if any(domain in url_lower for domain in ['youtube.com', 'youtu.be', 'youtube-nocookie.com']):
-            return 'youtube'
-        # Enhanced Twitter/X detection
-        elif any(domain in url_lower for domain in ['twitter.com', 'x.com', 'mobile.twitter.com', 'mobile.x.com']):
-            return 'twitter'
-        elif any(domain in url_lower for domain in ['facebook.com', 'fb.com', 'fb.watch', 'm.facebook.com']):
-            return 'facebook'
-        elif any(domain in url_lower for domain in ['tiktok.com', 'vm.tiktok.com', 'm.tiktok.com']):
-            return 'tiktok'
-        elif any(domain in url_lower for domain in ['instagram.com', 'instagr.am']):
-            return 'instagram'
-        elif url_lower.endswith('.m3u8') or 'm3u8' in url_lower:
+        if 'm3u8' in url_lower:
             return 'm3u8'
-        elif any(ext in url_lower for ext in ['.mp4', '.mkv', '.avi', '.webm', '.mov']):
+        elif direct_video_regex.search(url_lower):
             return 'direct'
         else:
             return 'unknown'
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     async def _get_video_quality_info(self, url: str, platform: str):
         """Get detailed video quality information including file sizes and available formats"""
-        try:
-            import subprocess
-            import json
-
-            # Enhanced yt-dlp command to get comprehensive format info
-            cmd = [
-                'yt-dlp',
-                '--dump-json',
-                '--no-download',
-                '--no-check-certificates',
-                '--no-warnings',
-                '--socket-timeout', '45',
-                '--list-formats',  # Get format list
-                '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                url
-            ]
+        return await VIDEO_INFO_CACHE.get_or_compute(canonical_url(url), lambda: self._probe_video_quality_info(url))
 
-            result = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-
-            stdout, stderr = await asyncio.wait_for(result.communicate(), timeout=60)
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    async def _probe_video_quality_info(self, url: str):
+        """Run the yt-dlp probe behind _get_video_quality_info's cache"""
+        try:
+            # In-process extraction on a worker thread's cached YoutubeDL; no interpreter start per probe
+            info = await asyncio.wait_for(run_blocking(extract_video_info, url), timeout=60)
+
+            if info and 'formats' in info:
+                # Enhanced format filtering with proper quality mapping
+                video_formats = []
+                audio_formats = []
+
+                for fmt in info['formats']:
+                    # Video formats with specific quality levels
+                    if fmt.get('height') and fmt.get('vcodec') != 'none':
+                        height = fmt['height']
+                        filesize = fmt.get('filesize') or fmt.get('filesize_approx') or 0
+
+                        # Map to standard quality levels
+                        quality_level = next((label for min_height, label in QUALITY_TIERS if height >= min_height), None)
+
+                        if quality_level:
+                            fmt['quality_level'] = quality_level
+                            fmt['filesize_mb'] = filesize * INV_MB if filesize > 0 else 0
+                            video_formats.append(fmt)
+
+                    # Audio-only formats with accurate size calculation
+                    elif fmt.get('acodec') != 'none' and fmt.get('vcodec') == 'none':
+                        filesize = fmt.get('filesize') or fmt.get('filesize_approx') or 0
+                        abr = fmt.get('abr', 0)
+                        duration = info.get('duration', 0)
+
+                        # Accurate audio size calculation
+                        if filesize:
+                            actual_size = filesize
+                        elif abr and duration:
+                            # Convert kbps to bytes: (kbps * duration_seconds * 1000) / 8
+                            actual_size = (abr * duration * 1000) / 8
+                        else:
+                            # Default estimation for good quality audio
+                            actual_size = (160 * duration * 1000) / 8 if duration else 8 * 1024 * 1024
+
+                        fmt['filesize'] = max(actual_size, 2 * 1024 * 1024)  # Minimum 2MB for quality
+                        fmt['filesize_mb'] = fmt['filesize'] * INV_MB
+                        audio_formats.append(fmt)
+
+                # Remove duplicates and sort by quality
+                unique_video_formats = []
+                seen_qualities = set()
+
+                for fmt in sorted(video_formats, key=lambda x: x.get('height', 0), reverse=True):
+                    quality = fmt.get('quality_level')
+                    if quality and quality not in seen_qualities:
+                        unique_video_formats.append(fmt)
+                        seen_qualities.add(quality)
+                        if len(unique_video_formats) >= 6:  # Limit to 6 qualities
+                            break
 
-            if result.returncode == 0 and stdout:
-                lines = stdout.decode().strip().split('\n')
-                for line in lines:
-                    if line.strip():
-                        try:
-                            info = json.loads(line)
-                            if 'formats' in info:
-                                # Enhanced format filtering with proper quality mapping
-                                video_formats = []
-                                audio_formats = []
-
-                                for fmt in info['formats']:
-                                    # Video formats with specific quality levels
-                                    if fmt.get('height') and fmt.get('vcodec') != 'none':
-                                        height = fmt['height']
-                                        filesize = fmt.get('filesize') or fmt.get('filesize_approx') or 0
-
-                                        # Map to standard quality levels
-                                        quality_level = None
-                                        if height >= 2160:
-                                            quality_level = '4K'
-                                        elif height >= 1440:
-                                            quality_level = '1440p'
-                                        elif height >= 1080:
-                                            quality_level = '1080p'
-                                        elif height >= 720:
-                                            quality_level = '720p'
-                                        elif height >= 480:
-                                            quality_level = '480p'
-                                        elif height >= 360:
-                                            quality_level = '360p'
-
-                                        if quality_level:
-                                            fmt['quality_level'] = quality_level
-                                            fmt['filesize_mb'] = filesize / (1024 * 1024) if filesize > 0 else 0
-                                            video_formats.append(fmt)
-
-                                    # Audio-only formats with accurate size calculation
-                                    elif fmt.get('acodec') != 'none' and fmt.get('vcodec') == 'none':
-                                        filesize = fmt.get('filesize') or fmt.get('filesize_approx') or 0
-                                        abr = fmt.get('abr', 0)
-                                        duration = info.get('duration', 0)
-
-                                        # Accurate audio size calculation
-                                        if filesize:
-                                            actual_size = filesize
-                                        elif abr and duration:
-                                            # Convert kbps to bytes: (kbps * duration_seconds * 1000) / 8
-                                            actual_size = (abr * duration * 1000) / 8
-                                        else:
-                                            # Default estimation for good quality audio
-                                            actual_size = (160 * duration * 1000) / 8 if duration else 8 * 1024 * 1024
-
-                                        fmt['filesize'] = max(actual_size, 2 * 1024 * 1024)  # Minimum 2MB for quality
-                                        fmt['filesize_mb'] = fmt['filesize'] / (1024 * 1024)
-                                        audio_formats.append(fmt)
-
-                                # Remove duplicates and sort by quality
-                                unique_video_formats = []
-                                seen_qualities = set()
-
-                                for fmt in sorted(video_formats, key=lambda x: x.get('height', 0), reverse=True):
-                                    quality = fmt.get('quality_level')
-                                    if quality and quality not in seen_qualities:
-                                        unique_video_formats.append(fmt)
-                                        seen_qualities.add(quality)
-                                        if len(unique_video_formats) >= 6:  # Limit to 6 qualities
-                                            break
-
-                                info['video_formats'] = unique_video_formats
-                                info['audio_formats'] = audio_formats[:3]  # Top 3 audio formats
-
-                                return info
-                        except json.JSONDecodeError:
-                            continue
+                info['video_formats'] = unique_video_formats
+                info['audio_formats'] = audio_formats[:3]  # Top 3 audio formats
+                return info
 
         except Exception as e:
             logger.error(f"Error getting enhanced quality info: {e}")
@@ -1293,7 +2149,7 @@ class SocialMediaDownloader:
     async def download_with_yt_dlp(self, url: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
         """Enhanced yt-dlp download with progressive quality selection for YouTube"""
         try:
-            platform = await self.get_platform(url)
+            platform = self.get_platform(url)
 
             # For YouTube, try different quality levels progressively
             if platform == 'youtube':
@@ -1305,23 +2161,42 @@ class SocialMediaDownloader:
                     ('480p', 'best[height<=480][ext=mp4]/bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480]'),
                 ]
 
-                for quality_name, format_selector in quality_levels:
-                    try:
-                        logger.info(f"Trying YouTube quality: {quality_name}")
+                await progress_tracker.update_compression_progress(
+                    "YouTube Download",
+                    f"Checking {', '.join(name for name, _ in quality_levels)} availability..."
+                )
 
-                        await progress_tracker.update_compression_progress(
-                            f"YouTube Download - {quality_name}",
-                            f"Attempting to download in {quality_name} quality..."
-                        )
+                # Probe every quality at once so unavailable top tiers cost one round-trip, not one each
+                probes = [
+                    (quality_name, format_selector, asyncio.create_task(self._probe_youtube_quality(url, format_selector)))
+                    for quality_name, format_selector in quality_levels
+                ]
+                try:
+                    # Walk in preference order; the first tier that probes and downloads wins
+                    for quality_name, format_selector, probe in probes:
+                        try:
+                            info = await probe
+                            logger.info(f"Trying YouTube quality: {quality_name}")
 
-                        result = await self._download_youtube_quality(url, format_selector, progress_tracker)
-                        if result[0]:
-                            logger.info(f"Successfully downloaded YouTube at {quality_name}")
-                            return result
+                            await progress_tracker.update_compression_progress(
+                                f"YouTube Download - {quality_name}",
+                                f"Attempting to download in {quality_name} quality..."
+                            )
 
-                    except Exception as e:
-                        logger.warning(f"YouTube {quality_name} failed: {e}")
-                        continue
+                            result = await self._fetch_youtube_quality(url, format_selector, info, progress_tracker)
+                            if result[0]:
+                                logger.info(f"Successfully downloaded YouTube at {quality_name}")
+                                return result
+
+                        except Exception as e:
+                            logger.warning(f"YouTube {quality_name} failed: {e}")
+                            continue
+                finally:
+                    for _, _, probe in probes:
+                        if not probe.done():
+                            probe.cancel()
+                        elif not probe.cancelled():
+                            probe.exception()  # Unused tiers that failed shouldn't log "exception never retrieved"
 
                 # If all qualities failed, try fallback
                 logger.warning("All YouTube qualities failed, trying fallback")
@@ -1337,10 +2212,17 @@ class SocialMediaDownloader:
 
     async def _download_youtube_quality(self, url: str, format_selector: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
         """Download YouTube video with specific quality and progress tracking"""
-        import subprocess
-        import json
+        info = await self._probe_youtube_quality(url, format_selector)
+        return await self._fetch_youtube_quality(url, format_selector, info, progress_tracker)
+
+    def _youtube_cookie_file(self) -> Optional[str]:
+        """Shared YouTube cookie file, written once per process; None when no cookies are configured"""
+        if 'SAPISID' not in _COOKIES_BY_PLATFORM['youtube']:
+            return None
+        return get_cookie_file('youtube', _COOKIES_BY_PLATFORM['youtube'])
 
-        # Get video info first
+    async def _probe_youtube_quality(self, url: str, format_selector: str) -> Dict:
+        """Resolve video info for one format selector without downloading; raises when the format is unavailable"""
         # Enhanced YouTube command with cookie support
         info_cmd = [
             'yt-dlp',
@@ -1358,197 +2240,111 @@ class SocialMediaDownloader:
         ]
 
         # Add YouTube cookies if available
-        if Config.YOUTUBE_SAPISID:
-            cookie_file = f"{self.temp_dir}/youtube_cookies.txt"
-            with open(cookie_file, 'w') as f:
-                f.write("# Netscape HTTP Cookie File\n")
-                f.write("# This is a generated file! Do not edit.\n\n")
-                if Config.YOUTUBE_SAPISID:
-                    f.write(f".youtube.com\tTRUE\t/\tTRUE\t0\tSAPISID\t{Config.YOUTUBE_SAPISID}\n")
-                if Config.YOUTUBE_SECURE_3PSID:
-                    f.write(f".youtube.com\tTRUE\t/\tTRUE\t0\t__Secure-3PSID\t{Config.YOUTUBE_SECURE_3PSID}\n")
-                if Config.YOUTUBE_APISID:
-                    f.write(f".youtube.com\tTRUE\t/\tTRUE\t0\tAPISID\t{Config.YOUTUBE_APISID}\n")
-                if Config.YOUTUBE_SID:
-                    f.write(f".youtube.com\tTRUE\t/\tTRUE\t0\tSID\t{Config.YOUTUBE_SID}\n")
+        cookie_file = self._youtube_cookie_file()
+        if cookie_file:
             info_cmd.extend(['--cookies', cookie_file])
 
-        info_result = subprocess.run(
-            info_cmd,
-            capture_output=True,
-            text=True,
-            timeout=60,
-            check=False
-        )
-
-        if info_result.returncode != 0:
-            raise Exception(f"Info extraction failed: {info_result.stderr}")
+        # Concurrent tier probes wait on the loop instead of each holding an executor thread
+        return await first_json_line(info_cmd, timeout=60)
 
-        # Parse info
-        info = None
-        for line in info_result.stdout.strip().split('\n'):
-            if line.strip():
-                try:
-                    info = json.loads(line)
-                    break
-                except json.JSONDecodeError:
-                    continue
-
-        if not info:
-            raise Exception("No video info found")
+    async def _fetch_youtube_quality(self, url: str, format_selector: str, info: Dict, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
+        """Download a probed YouTube format with progress tracking"""
+        cookie_file = self._youtube_cookie_file()
 
         # Download with progress tracking
-        output_template = f'{self.temp_dir}/%(title)s.%(ext)s'
+        dl_dir = self._download_dir()
+        output_template = f'{dl_dir}/%(title)s.%(ext)s'
 
-        def run_download():
-            download_cmd = [
-                'yt-dlp',
-                '--format', format_selector,
-                '--output', output_template,
-                '--write-info-json',
-                '--no-check-certificates',
-                '--socket-timeout', '120',
-                '--fragment-retries', '10',
-                '--retries', '5',
-                '--merge-output-format', 'mp4',
-                '--prefer-ffmpeg',
-                '--embed-thumbnail',
-                '--add-metadata',
-                '--progress',
-                '--newline',
-                '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                '--extractor-args', 'youtube:player_client=web,mweb',
-                url
-            ]
-
-            # Add cookies to download command if available
-            if Config.YOUTUBE_SAPISID and 'cookie_file' in locals():
-                download_cmd.extend(['--cookies', cookie_file])
+        download_cmd = [
+            'yt-dlp',
+            '--format', format_selector,
+            '--output', output_template,
+            '--write-info-json',
+            '--no-check-certificates',
+            '--socket-timeout', '120',
+            '--fragment-retries', '10',
+            '--retries', '5',
+            '--merge-output-format', 'mp4',
+            '--prefer-ffmpeg',
+            '--embed-thumbnail',
+            '--add-metadata',
+            *YTDLP_PROGRESS_ARGS,
+            '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            '--extractor-args', 'youtube:player_client=web,mweb',
+            url
+        ]
 
-            return subprocess.run(
-                download_cmd,
-                capture_output=True,
-                text=True,
-                timeout=300,  # 5 minutes for YouTube
-                check=False
-            )
+        # Add cookies to download command if available
+        if cookie_file:
+            download_cmd.extend(['--cookies', cookie_file])
 
-        # Run download in thread
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_download)
-            download_result = future.result(timeout=320)
+        # 5 minutes for YouTube; awaiting the child directly leaves no thread parked per download
+        download_result = await run_ytdlp(download_cmd, timeout=300, progress_tracker=progress_tracker)
 
         if download_result.returncode != 0:
             raise Exception(f"Download failed: {download_result.stderr}")
 
         # Find downloaded file
-        for file in Path(self.temp_dir).glob("*"):
-            if file.suffix in ['.mp4', '.mkv', '.webm', '.avi'] and file.stat().st_size > 0:
-                file_size = file.stat().st_size
-
-                # For YouTube, only compress if larger than 2GB (not 50MB limit)
-                if file_size > 2 * 1024 * 1024 * 1024:  # 2GB
-                    logger.warning(f"YouTube file too large: {file_size/1024/1024:.1f} MB")
-                    return None, None
-                elif file_size > Config.MAX_FILE_SIZE:
-                    # Compress for Telegram's 50MB limit
-                    compressed_file = await self._compress_video_ultra_fast(str(file), progress_tracker)
-                    if compressed_file:
-                        file = Path(compressed_file)
+        for file, file_size in iter_video_files(dl_dir):
+            # For YouTube, only compress if larger than 2GB (not 50MB limit)
+            if file_size > 2 * 1024 * 1024 * 1024:  # 2GB
+                logger.warning(f"YouTube file too large: {file_size/1024/1024:.1f} MB")
+                return None, None
+            elif file_size > Config.MAX_FILE_SIZE:
+                # Compress for Telegram's 50MB limit
+                compressed_file = await self._compress_video_ultra_fast(str(file), progress_tracker, info.get('duration'))
+                if compressed_file:
+                    file = Path(compressed_file)
 
-                metadata = {
-                    'title': info.get('title', 'YouTube Video'),
-                    'description': info.get('description', ''),
-                    'duration': info.get('duration'),
-                    'uploader': info.get('uploader', ''),
-                    'upload_date': info.get('upload_date', ''),
-                    'view_count': info.get('view_count'),
-                    'like_count': info.get('like_count'),
-                    'platform': 'youtube'
-                }
+            metadata = {
+                'title': info.get('title', 'YouTube Video'),
+                'description': info.get('description', ''),
+                'duration': info.get('duration'),
+                'uploader': info.get('uploader', ''),
+                'upload_date': info.get('upload_date', ''),
+                'view_count': info.get('view_count'),
+                'like_count': info.get('like_count'),
+                'platform': 'youtube'
+            }
 
-                return str(file), metadata
+            return str(file), metadata
 
         return None, None
 
     async def _download_youtube_fallback(self, url: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
         """Fallback YouTube download with basic format"""
-        import subprocess
-        import json
-
+        dl_dir = self._download_dir()
         cmd = [
             'yt-dlp',
             '--format', 'best[ext=mp4]/best/worst',
-            '--output', f'{self.temp_dir}/%(title)s.%(ext)s',
+            '--output', f'{dl_dir}/%(title)s.%(ext)s',
             '--write-info-json',
             '--merge-output-format', 'mp4',
             '--prefer-ffmpeg',
             url
         ]
 
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300,
-            check=False
-        )
+        result = await run_process(cmd, timeout=300)
 
         if result.returncode == 0:
-            for file in Path(self.temp_dir).glob("*"):
-                if file.suffix in ['.mp4', '.mkv', '.webm', '.avi'] and file.stat().st_size > 0:
-                    metadata = {
-                        'title': 'YouTube Video (Fallback)',
-                        'platform': 'youtube'
-                    }
-                    return str(file), metadata
+            for file, _ in iter_video_files(dl_dir):
+                metadata = {
+                    'title': 'YouTube Video (Fallback)',
+                    'platform': 'youtube'
+                }
+                return str(file), metadata
 
         return None, None
 
     async def _download_with_enhanced_compression(self, url: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
         """Enhanced download with smart compression for large files"""
-        import subprocess
-        import json
-
-        # First get video info
-        info_cmd = [
-            'yt-dlp',
-            '--dump-json',
-            '--no-download',
-            '--format', 'best[height<=1080]/best/worst',
-            '--no-check-certificates',
-            '--no-warnings',
-            '--socket-timeout', '60',
-            '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            '--extractor-args', 'facebook:api_version=v18.0',
-            url
-        ]
-
         try:
-            info_result = subprocess.run(
-                info_cmd,
-                capture_output=True,
-                text=True,
-                timeout=120,
-                check=False
-            )
-
-            info = None
-            if info_result.returncode == 0:
-                for line in info_result.stdout.strip().split('\n'):
-                    if line.strip():
-                        try:
-                            info = json.loads(line)
-                            break
-                        except json.JSONDecodeError:
-                            continue
-
-            # Enhanced download with better format selection
+            # One yt-dlp run: metadata comes from the --write-info-json sidecar rather than a separate --dump-json probe
+            dl_dir = self._download_dir()
             download_cmd = [
                 'yt-dlp',
                 '--format', 'best[height<=2160][ext=mp4]/bestvideo[height<=2160][ext=mp4]+bestaudio[ext=m4a]/best[height<=1440][ext=mp4]/bestvideo[height<=1440][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080][ext=mp4]/bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=720][ext=mp4]/bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/bestvideo[ext=mp4]+bestaudio[ext=m4a]/best',
-                '--output', f'{self.temp_dir}/%(title)s.%(ext)s',
+                '--output', f'{dl_dir}/%(title)s.%(ext)s',
                 '--write-info-json',
                 '--no-check-certificates',
                 '--socket-timeout', '120',
@@ -1558,63 +2354,60 @@ class SocialMediaDownloader:
                 '--prefer-ffmpeg',
                 '--embed-thumbnail',
                 '--add-metadata',
-                '--progress',
-                '--newline',
+                *YTDLP_PROGRESS_ARGS,
                 '--user-agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
                 '--extractor-args', 'facebook:api_version=v18.0',
                 url
             ]
 
-            download_result = subprocess.run(
-                download_cmd,
-                capture_output=True,
-                text=True,
-                timeout=600,
-                check=False
-            )
+            download_result = await run_ytdlp(download_cmd, timeout=600, progress_tracker=progress_tracker)
 
             if download_result.returncode != 0:
                 raise Exception(f"Download failed: {download_result.stderr}")
 
             # Find downloaded file and handle compression
-            for file in Path(self.temp_dir).glob("*"):
-                if file.suffix in ['.mp4', '.mkv', '.webm', '.avi'] and file.stat().st_size > 0:
-                    file_size = file.stat().st_size
+            for file, file_size in iter_video_files(dl_dir):
+                info = None
+                try:
+                    async with aiofiles.open(file.with_suffix('.info.json'), 'rb') as f:
+                        info = orjson.loads(await f.read())
+                except (OSError, orjson.JSONDecodeError):
+                    pass
 
-                    # Enhanced compression for large files
-                    if file_size > Config.MAX_FILE_SIZE:
-                        logger.info(f"File size {file_size/1024/1024:.1f} MB > {Config.MAX_FILE_SIZE/1024/1024:.1f} MB, using smart compression...")
+                # Enhanced compression for large files
+                if file_size > Config.MAX_FILE_SIZE:
+                    logger.info(f"File size {file_size/1024/1024:.1f} MB > {Config.MAX_FILE_SIZE/1024/1024:.1f} MB, using smart compression...")
 
-                        await progress_tracker.update_compression_progress(
-                            "Smart Compression",
-                            f"Original size: {file_size/1024/1024:.1f} MB\nOptimizing for fast upload..."
-                        )
+                    await progress_tracker.update_compression_progress(
+                        "Smart Compression",
+                        f"Original size: {file_size/1024/1024:.1f} MB\nOptimizing for fast upload..."
+                    )
 
-                        compressed_file = await self._compress_video_smart(str(file), progress_tracker)
-                        if compressed_file and os.path.exists(compressed_file):
-                            compressed_size = os.path.getsize(compressed_file)
-                            if compressed_size <= Config.MAX_FILE_SIZE:
-                                logger.info(f"Smart compression: {file_size/1024/1024:.1f} MB → {compressed_size/1024/1024:.1f} MB")
-                                file = Path(compressed_file)
-                            else:
-                                logger.warning(f"Compressed file still too large: {compressed_size/1024/1024:.1f} MB")
-                                return None, None
+                    compressed_file = await self._compress_video_smart(str(file), progress_tracker)
+                    compressed_size = stat_size(compressed_file) if compressed_file else 0
+                    if compressed_size:
+                        if compressed_size <= Config.MAX_FILE_SIZE:
+                            logger.info(f"Smart compression: {file_size/1024/1024:.1f} MB → {compressed_size/1024/1024:.1f} MB")
+                            file = Path(compressed_file)
                         else:
-                            logger.warning("Smart compression failed")
+                            logger.warning(f"Compressed file still too large: {compressed_size/1024/1024:.1f} MB")
                             return None, None
+                    else:
+                        logger.warning("Smart compression failed")
+                        return None, None
 
-                    metadata = {
-                        'title': info.get('title', 'Downloaded Video') if info else 'Downloaded Video',
-                        'description': info.get('description', '') if info else '',
-                        'duration': info.get('duration') if info else None,
-                        'uploader': info.get('uploader', '') if info else '',
-                        'upload_date': info.get('upload_date', '') if info else '',
-                        'view_count': info.get('view_count') if info else None,
-                        'like_count': info.get('like_count') if info else None,
-                        'platform': info.get('extractor_key', '').lower() if info else 'unknown'
-                    }
+                metadata = {
+                    'title': info.get('title', 'Downloaded Video') if info else 'Downloaded Video',
+                    'description': info.get('description', '') if info else '',
+                    'duration': info.get('duration') if info else None,
+                    'uploader': info.get('uploader', '') if info else '',
+                    'upload_date': info.get('upload_date', '') if info else '',
+                    'view_count': info.get('view_count') if info else None,
+                    'like_count': info.get('like_count') if info else None,
+                    'platform': info.get('extractor_key', '').lower() if info else 'unknown'
+                }
 
-                    return str(file), metadata
+                return str(file), metadata
 
             return None, None
 
@@ -1628,15 +2421,7 @@ class SocialMediaDownloader:
     async def download_video_enhanced(self, url: str, quality_preference: str = "720p", format_preference: str = "mp4", progress_callback=None) -> Dict:
         """Enhanced download method for web interface with quality preferences"""
         try:
-            platform = await self.get_platform(url)
-            
-            # Map web interface quality preferences to yt-dlp format strings
-            quality_map = {
-                "1080p": "best[height<=1080][ext=mp4]/bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080]",
-                "720p": "best[height<=720][ext=mp4]/bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720]",
-                "480p": "best[height<=480][ext=mp4]/bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480]",
-                "4k": "best[height<=2160][ext=mp4]/bestvideo[height<=2160][ext=mp4]+bestaudio[ext=m4a]/best[height<=2160]",
-            }
+            platform = self.get_platform(url)
             
             # Handle audio format preference
             if format_preference == "mp3":
@@ -1644,15 +2429,10 @@ class SocialMediaDownloader:
             elif format_preference == "webm":
                 format_string = f"best[height<={quality_preference[:-1] if quality_preference.endswith('p') else '720'}][ext=webm]/best[ext=webm]"
             else:
-                format_string = quality_map.get(quality_preference, quality_map["720p"])
-            
-            # Create dummy progress tracker if none provided
-            class DummyProgressTracker:
-                async def update_progress(self, current: int, total: int, speed: str = "", stage: str = "Downloading"):
-                    if progress_callback:
-                        await progress_callback(current, total, speed, stage)
+                format_string = _QUALITY_MAP.get(quality_preference, _QUALITY_MAP["720p"])
             
-            dummy_tracker = DummyProgressTracker()
+            # Forward download ticks to the caller's callback, if any
+            dummy_tracker = CallbackTracker(progress_callback) if progress_callback else _NOOP_TRACKER
             
             # Try enhanced download with proper quality
             try:
@@ -1661,15 +2441,15 @@ class SocialMediaDownloader:
                 else:
                     file_path, metadata = await self._download_with_enhanced_compression(url, dummy_tracker)
                 
-                if file_path and os.path.exists(file_path):
-                    file_size = os.path.getsize(file_path)
+                file_size = stat_size(file_path) if file_path else 0
+                if file_size:
                     
                     # Ensure file doesn't exceed 2GB limit
                     if file_size > Config.MAX_VIDEO_SIZE:
                         logger.warning(f"File too large: {file_size/1024/1024/1024:.1f} GB > 2GB limit")
                         try:
-                            os.unlink(file_path)
-                        except:
+                            await aiofiles.os.remove(file_path)
+                        except OSError:
                             pass
                         return {
                             'success': False,
@@ -1797,71 +2577,20 @@ class SocialMediaDownloader:
         try:
             logger.info(f"Trying enhanced cookie-based download for {platform}")
 
-            # Prepare enhanced cookies for different platforms from .env
-            cookies = {}
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            }
-
-            if platform == 'instagram':
-                if Config.INSTAGRAM_SESSIONID:
-                    cookies['sessionid'] = Config.INSTAGRAM_SESSIONID
-                    headers['X-IG-App-ID'] = '936619743392459'
-                if Config.INSTAGRAM_CSRF_TOKEN:
-                    cookies['csrftoken'] = Config.INSTAGRAM_CSRF_TOKEN
-
-            elif platform == 'facebook':
-                if Config.FACEBOOK_CUSER:
-                    cookies['c_user'] = Config.FACEBOOK_CUSER
-                if Config.FACEBOOK_XS:
-                    cookies['xs'] = Config.FACEBOOK_XS
-                if Config.FACEBOOK_FR:
-                    cookies['fr'] = Config.FACEBOOK_FR
-                if Config.FACEBOOK_DATR:
-                    cookies['datr'] = Config.FACEBOOK_DATR
-
-            elif platform == 'twitter':
-                if Config.TWITTER_AUTH_TOKEN:
-                    cookies['auth_token'] = Config.TWITTER_AUTH_TOKEN
-                if Config.TWITTER_CT0:
-                    cookies['ct0'] = Config.TWITTER_CT0
-                if Config.TWITTER_TWID:
-                    cookies['twid'] = Config.TWITTER_TWID
-                if Config.TWITTER_GUEST_ID:
-                    cookies['guest_id'] = Config.TWITTER_GUEST_ID
-                if Config.TWITTER_CF_CLEARANCE:
-                    cookies['cf_clearance'] = Config.TWITTER_CF_CLEARANCE
-                if Config.TWITTER_CUID:
-                    cookies['_cuid'] = Config.TWITTER_CUID
-
-            elif platform == 'youtube':
-                if Config.YOUTUBE_SAPISID:
-                    cookies['SAPISID'] = Config.YOUTUBE_SAPISID
-                if Config.YOUTUBE_SECURE_3PSID:
-                    cookies['__Secure-3PSID'] = Config.YOUTUBE_SECURE_3PSID
-                if Config.YOUTUBE_APISID:
-                    cookies['APISID'] = Config.YOUTUBE_APISID
-                if Config.YOUTUBE_SID:
-                    cookies['SID'] = Config.YOUTUBE_SID
-
+            cookies = _COOKIES_BY_PLATFORM.get(platform)
             if not cookies:
                 logger.warning(f"No cookies available for {platform}")
                 return None, None
 
             # Use yt-dlp with cookies
-            cookie_file = f"{self.temp_dir}/cookies.txt"
-            with open(cookie_file, 'w') as f:
-                for name, value in cookies.items():
-                    f.write(f"# Netscape HTTP Cookie File\n")
-                    domain = '.instagram.com' if platform == 'instagram' else '.facebook.com' if platform == 'facebook' else '.twitter.com'
-                    f.write(f"{domain}\tTRUE\t/\tTRUE\t0\t{name}\t{value}\n")
-
-            import subprocess
+            cookie_file = get_cookie_file(platform, cookies)
+
+            dl_dir = self._download_dir()
             cmd = [
                 'yt-dlp',
                 '--cookies', cookie_file,
                 '--format', 'best[height<=2160]/best[height<=1440]/best[height<=1080]/best[height<=720]/best',
-                '--output', f'{self.temp_dir}/%(title)s.%(ext)s',
+                '--output', f'{dl_dir}/%(title)s.%(ext)s',
                 '--write-info-json',
                 '--no-check-certificates',
                 '--socket-timeout', '120',
@@ -1871,116 +2600,99 @@ class SocialMediaDownloader:
             ]
 
             logger.info(f"Running yt-dlp with cookies: {' '.join(cmd)}")
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=600,
-                check=False
-            )
+            result = await run_process(cmd, timeout=600)
+
+            if result.returncode == 0:
+                # Find downloaded file
+                for file, file_size in iter_video_files(dl_dir):
+                    if file_size > Config.MAX_FILE_SIZE:
+                        # Compress if needed
+                        compressed_file = await self._compress_video_ultra_fast(str(file), progress_tracker)
+                        if compressed_file and os.path.exists(compressed_file):
+                            file = Path(compressed_file)
+                        else:
+                            return None, None
 
-            if result.returncode == 0:
-                # Find downloaded file
-                for file in Path(self.temp_dir).glob("*"):
-                    if file.suffix in ['.mp4', '.mkv', '.webm', '.avi'] and file.stat().st_size > 0:
-                        file_size = file.stat().st_size
-                        if file_size > Config.MAX_FILE_SIZE:
-                            # Compress if needed
-                            compressed_file = await self._compress_video_ultra_fast(str(file), progress_tracker)
-                            if compressed_file and os.path.exists(compressed_file):
-                                file = Path(compressed_file)
-                            else:
-                                return None, None
-
-                        # Read metadata from info.json file if available
-                        info_file = str(file).replace(file.suffix, '.info.json')
-                        metadata = {
-                            'title': f'{platform.title()} Video',
-                            'description': 'Downloaded with enhanced method',
-                            'platform': platform
-                        }
+                    # Read metadata from info.json file if available
+                    info_file = str(file).replace(file.suffix, '.info.json')
+                    metadata = {
+                        'title': f'{platform.title()} Video',
+                        'description': 'Downloaded with enhanced method',
+                        'platform': platform
+                    }
 
-                        if os.path.exists(info_file):
-                            try:
-                                with open(info_file, 'r', encoding='utf-8') as f:
-                                    info_data = json.load(f)
-                                    metadata.update({
-                                        'title': info_data.get('title', metadata['title']),
-                                        'description': info_data.get('description', metadata['description']),
-                                        'uploader': info_data.get('uploader', ''),
-                                        'duration': info_data.get('duration'),
-                                        'upload_date': info_data.get('upload_date', ''),
-                                        'view_count': info_data.get('view_count'),
-                                        'like_count': info_data.get('like_count')
-                                    })
-                                logger.info(f"Enhanced filename: {metadata['title'][:30]}_{platform.upper()}{file.suffix}")
-                            except Exception as e:
-                                logger.warning(f"Could not read info file: {e}")
-
-                        return str(file), metadata
+                    try:
+                        with open(info_file, 'rb') as f:
+                            info_data = orjson.loads(f.read())
+                            metadata.update({
+                                'title': info_data.get('title', metadata['title']),
+                                'description': info_data.get('description', metadata['description']),
+                                'uploader': info_data.get('uploader', ''),
+                                'duration': info_data.get('duration'),
+                                'upload_date': info_data.get('upload_date', ''),
+                                'view_count': info_data.get('view_count'),
+                                'like_count': info_data.get('like_count')
+                            })
+                        logger.info(f"Enhanced filename: {metadata['title'][:30]}_{platform.upper()}{file.suffix}")
+                    except FileNotFoundError:
+                        pass
+                    except Exception as e:
+                        logger.warning(f"Could not read info file: {e}")
+
+                    return str(file), metadata
             else:
                 logger.error(f"Cookie-based download failed: {result.stderr}")
 
-            # Cleanup cookie file
-            try:
-                os.unlink(cookie_file)
-            except:
-                pass
-
         except Exception as e:
             logger.error(f"Cookie download failed: {e}")
 
         return None, None
 
-    async def _compress_video_ultra_fast(self, file_path: str, progress_tracker: ProgressTracker) -> Optional[str]:
-        """Ultra-fast compression optimized for speed"""
+    async def _compress_video_ultra_fast(self, file_path: str, progress_tracker: ProgressTracker,
+                                         duration: Optional[float] = None) -> Optional[str]:
+        """Ultra-fast compression optimized for speed, bitrate-capped so the result fits Telegram's limit"""
         try:
             original_size = os.path.getsize(file_path)
-            compressed_path = f"{self.temp_dir}/ultra_fast_{int(time.time())}.mp4"
+            compressed_path = self._temp_path("ultra_fast")
 
             await progress_tracker.update_compression_progress(
                 "Ultra-Fast Compression",
                 f"Original: {original_size/1024/1024:.1f} MB\nOptimizing for speed..."
             )
 
-            def compress_ultra_fast():
-                try:
-                    import subprocess
-                    # Ultra-fast compression with minimal CPU usage
-                    cmd = [
-                        'ffmpeg', '-i', file_path,
-                        '-c:v', 'libx264',
-                        '-preset', 'superfast',  # Even faster than ultrafast
-                        '-crf', '30',           # Faster compression, smaller files
-                        '-c:a', 'aac',
-                        '-b:a', '64k',          # Even lower audio bitrate for speed
-                        '-movflags', '+faststart',
-                        '-threads', '0',        # Use all available cores
-                        '-y',
-                        compressed_path
-                    ]
-
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-
-                    if result.returncode == 0 and os.path.exists(compressed_path):
-                        return compressed_path
-                    else:
-                        logger.error(f"Ultra-fast compression failed: {result.stderr}")
-                        return None
-
-                except Exception as e:
-                    logger.error(f"Ultra-fast compression error: {e}")
-                    return None
+            media = await probe_media(file_path)
+            if media:
+                duration = duration or float(media.get('format', {}).get('duration') or 0) or None
+                if await self._shrink_audio_only(file_path, compressed_path, media, duration):
+                    logger.info(f"Audio-only re-encode: {original_size/1024/1024:.1f} MB → {os.path.getsize(compressed_path)/1024/1024:.1f} MB")
+                    return compressed_path
+
+            # CRF keeps easy scenes small; the cap stops complex footage overshooting into a second, aggressive pass.
+            # With a known duration the cap is the bitrate that spends 90% of the size limit, less the audio.
+            maxrate = 1500
+            if duration:
+                maxrate = max(200, int(Config.MAX_FILE_SIZE * 8 * 0.9 / duration / 1000) - 64)
+
+            # Ultra-fast compression with minimal CPU usage
+            result = await ffmpeg_encode(
+                timeout=120,
+                on_progress=ffmpeg_progress_reporter(progress_tracker, "Ultra-Fast Compression", duration) if duration else None,
+                src=file_path,
+                dst=compressed_path,
+                preset='ultrafast',
+                crf='28',
+                maxrate=f'{maxrate}k',
+                audio_bitrate='64k'  # Even lower audio bitrate for speed
+            )
 
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
-                future = executor.submit(compress_ultra_fast)
-                result = future.result(timeout=150)
+            if result.returncode != 0:
+                logger.error(f"Ultra-fast compression failed: {result.stderr}")
+                return None
 
-            if result and os.path.exists(result):
-                final_size = os.path.getsize(result)
+            final_size = stat_size(compressed_path)
+            if final_size:
                 logger.info(f"Ultra-fast compression: {original_size/1024/1024:.1f} MB → {final_size/1024/1024:.1f} MB")
-                return result
+                return compressed_path
 
             return None
 
@@ -1988,6 +2700,28 @@ class SocialMediaDownloader:
             logger.error(f"Ultra-fast compression failed: {e}")
             return None
 
+    async def _shrink_audio_only(self, src: str, dst: str, media: Dict, duration: Optional[float]) -> bool:
+        """Copy an H.264 video stream untouched and only re-encode the audio, when that alone gets under the limit"""
+        streams = media.get('streams', [])
+        video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+        if not (duration and video and audio and video.get('codec_name') == 'h264' and audio.get('bit_rate')):
+            return False
+
+        # Remuxing alone can't shrink anything; the only saving without touching video is a leaner audio track
+        audio_saving = (int(audio['bit_rate']) - 64000) * duration / 8
+        if os.path.getsize(src) - audio_saving > Config.MAX_FILE_SIZE * 0.97:
+            return False
+
+        cmd = [*FFMPEG, '-i', src, '-map', '0:v:0', '-map', '0:a:0', '-c:v', 'copy',
+               '-c:a', 'aac', '-b:a', '64k', '-movflags', '+faststart', '-y', dst]
+        async with COMPRESS_SEM:
+            result = await run_process(cmd, timeout=120)
+        if result.returncode == 0 and 0 < os.path.getsize(dst) <= Config.MAX_FILE_SIZE:
+            return True
+        logger.warning(f"Audio-only re-encode didn't fit, transcoding instead: {result.stderr}")
+        return False
+
     async def _compress_video_smart(self, file_path: str, progress_tracker: ProgressTracker) -> Optional[str]:
         """Smart compression with multiple strategies for different file types"""
         try:
@@ -2015,67 +2749,41 @@ class SocialMediaDownloader:
                 {"height": 360, "bitrate": "400k", "audio": "64k", "crf": "32", "preset": "veryfast"},
             ]
 
-            for i, level in enumerate(compression_levels):
-                compressed_path = f"{self.temp_dir}/aggressive_{level['height']}p_{int(time.time())}.mp4"
-
-                try:
-                    await progress_tracker.update_compression_progress(
-                        f"Aggressive Compression - {level['height']}p",
-                        f"Level {i+1}/{len(compression_levels)}\nTarget size: <50MB"
-                    )
-
-                    def compress_level():
-                        try:
-                            import subprocess
-                            cmd = [
-                                'ffmpeg', '-i', file_path,
-                                '-vf', f"scale=-2:{level['height']}",
-                                '-c:v', 'libx264',
-                                '-preset', level['preset'],
-                                '-crf', level['crf'],
-                                '-maxrate', level['bitrate'],
-                                '-bufsize', str(int(level['bitrate'][:-1]) * 2) + 'k',
-                                '-c:a', 'aac',
-                                '-b:a', level['audio'],
-                                '-movflags', '+faststart',
-                                '-threads', '0',
-                                '-y',
-                                compressed_path
-                            ]
-
-                            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-
-                            if result.returncode == 0 and os.path.exists(compressed_path):
-                                compressed_size = os.path.getsize(compressed_path)
-                                if compressed_size <= Config.MAX_FILE_SIZE:
-                                    return compressed_path
-                                else:
-                                    try:
-                                        os.unlink(compressed_path)
-                                    except:
-                                        pass
-                                    return None
-                            else:
-                                logger.error(f"Compression level {level['height']}p failed: {result.stderr}")
-                                return None
-
-                        except Exception as e:
-                            logger.error(f"Compression level {level['height']}p error: {e}")
-                            return None
+            outputs = [self._temp_path(f"aggressive_{level['height']}p") for level in compression_levels]
 
-                    import concurrent.futures
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
-                        future = executor.submit(compress_level)
-                        result = future.result(timeout=360)
+            await progress_tracker.update_compression_progress(
+                "Aggressive Compression",
+                f"Encoding {', '.join(str(level['height']) + 'p' for level in compression_levels)} in one pass\nTarget size: <50MB"
+            )
 
-                    if result and os.path.exists(result):
-                        final_size = os.path.getsize(result)
-                        logger.info(f"Aggressive compression {level['height']}p: {original_size/1024/1024:.1f} MB → {final_size/1024/1024:.1f} MB")
-                        return result
+            media = await probe_media(file_path)
+            duration = float((media or {}).get('format', {}).get('duration') or 0)
 
-                except Exception as e:
-                    logger.warning(f"Compression level {level['height']}p failed: {e}")
+            # Decode once and encode every level from the same frames
+            result = await ffmpeg_encode(
+                timeout=600,
+                on_progress=ffmpeg_progress_reporter(progress_tracker, "Aggressive Compression", duration) if duration else None,
+                build=ffmpeg_ladder_cmd,
+                src=file_path,
+                levels=compression_levels,
+                outputs=outputs
+            )
+            if result.returncode != 0:
+                logger.error(f"Aggressive compression failed: {result.stderr}")
+
+            # Keep the highest resolution that fits, drop the rest
+            chosen = None
+            for level, output in zip(compression_levels, outputs):
+                if chosen is None and result.returncode == 0 and 0 < os.path.getsize(output) <= Config.MAX_FILE_SIZE:
+                    chosen = output
+                    logger.info(f"Aggressive compression {level['height']}p: {original_size/1024/1024:.1f} MB → {os.path.getsize(output)/1024/1024:.1f} MB")
                     continue
+                try:
+                    await aiofiles.os.remove(output)
+                except OSError:
+                    pass
+            if chosen:
+                return chosen
 
             logger.error("All compression levels failed")
             return None
@@ -2084,16 +2792,71 @@ class SocialMediaDownloader:
             logger.error(f"Aggressive compression failed: {e}")
             return None
 
+    async def _range_download(self, url: str, dest: str, total_size: int, headers: Dict[str, str],
+                              progress_tracker: ProgressTracker, conns: int = RANGE_DOWNLOAD_CONNECTIONS) -> bool:
+        """Fetch disjoint byte ranges in parallel into a preallocated file; False means fall back to one stream"""
+        conns = max(1, min(conns, total_size // RANGE_DOWNLOAD_MIN_PART))
+        part = -(-total_size // conns)
+        ranges = [(start, min(start + part, total_size) - 1) for start in range(0, total_size, part)]
+        downloaded = 0
+        pending_writes = set()
+        timeout = httpx.Timeout(connect=10.0, read=300.0, write=300.0, pool=10.0)
+
+        async def write_at(data: bytes, offset: int):
+            nonlocal downloaded
+            write = asyncio.ensure_future(asyncio.to_thread(os.pwrite, fd, data, offset))
+            pending_writes.add(write)
+            write.add_done_callback(pending_writes.discard)
+            await asyncio.shield(write)  # Cancellation must not detach the write from its tracking
+            downloaded += len(data)
+            await progress_tracker.update_progress(downloaded, total_size, stage="Downloading")
+
+        async def fetch(start: int, end: int):
+            offset = start
+            range_headers = {**headers, 'Range': f'bytes={start}-{end}'}
+            async with self.session.stream('GET', url, headers=range_headers, timeout=timeout) as response:
+                if response.status_code != 206:
+                    raise ValueError(f"server answered range request with {response.status_code}")
+                # Socket reads are gathered so each thread hop carries a STREAM_WRITE_SIZE pwrite, not one per read
+                buf = bytearray()
+                async for chunk in response.aiter_raw():
+                    buf += chunk
+                    if len(buf) >= STREAM_WRITE_SIZE:
+                        data = bytes(buf)
+                        buf.clear()
+                        await write_at(data, offset)
+                        offset += len(data)
+                if buf:
+                    await write_at(bytes(buf), offset)
+                    offset += len(buf)
+            if offset != end + 1:
+                raise ValueError(f"range {start}-{end} ended early at {offset}")
+
+        fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            allocate(fd, total_size)
+            logger.info(f"Downloading direct file: {total_size/1024/1024:.1f} MB over {len(ranges)} connections")
+            async with asyncio.TaskGroup() as group:
+                for start, end in ranges:
+                    group.create_task(fetch(start, end))
+            return True
+        except Exception as e:
+            logger.warning(f"Range download failed, falling back to a single stream: {e}")
+            return False
+        finally:
+            # Cancelled fetches can leave a pwrite running in its thread; let it land before the fd goes away
+            if pending_writes:
+                await asyncio.gather(*pending_writes, return_exceptions=True)
+            os.close(fd)
+
     async def _download_direct_url_enhanced(self, url: str, progress_tracker: ProgressTracker, metadata: Dict) -> Tuple[Optional[str], Optional[Dict]]:
         """Enhanced direct URL download with better progress tracking"""
         try:
             # Get file extension from URL
             url_path = urlparse(url).path
             file_ext = os.path.splitext(url_path)[1] or '.mp4'
-            filename = f"{self.temp_dir}/video_{int(time.time())}{file_ext}"
+            filename = self._temp_path("video", file_ext)
 
-            # Enhanced timeout and headers
-            timeout = httpx.Timeout(connect=10.0, read=300.0, write=300.0, pool=10.0)  # Faster timeouts
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
                 'Accept': '*/*',
@@ -2102,63 +2865,78 @@ class SocialMediaDownloader:
                 'Range': 'bytes=0-'  # Enable resume support
             }
 
-            async with httpx.AsyncClient(timeout=timeout, headers=headers) as client:
-                # Get file size
-                try:
-                    head_response = await client.head(url, timeout=15.0)
-                    if head_response.status_code == 200:
-                        total_size = int(head_response.headers.get('content-length', 0))
-                    else:
-                        total_size = 0
-                except:
+            # Reuse the downloader's pooled client so repeat hosts skip the TCP/TLS handshake
+            client = self.session
+            # Get file size
+            accepts_ranges = False
+            final_url = url
+            try:
+                # Follow redirects here so the transfer goes straight to the (often signed) CDN URL
+                head_response = await client.head(url, headers=headers, timeout=15.0, follow_redirects=True)
+                final_url = str(head_response.url)
+                if head_response.status_code in (200, 206):
+                    total_size = int(head_response.headers.get('content-length', 0))
+                    accepts_ranges = (head_response.status_code == 206
+                                      or head_response.headers.get('accept-ranges', '').lower() == 'bytes')
+                else:
                     total_size = 0
+            except (httpx.HTTPError, ValueError):
+                total_size = 0
+
+            # Large files from range-capable servers come down over several connections at once
+            ranged = (accepts_ranges and total_size >= RANGE_DOWNLOAD_MIN_SIZE
+                      and await self._range_download(final_url, filename, total_size, headers, progress_tracker))
+
+            if not ranged:
+                # The body copy runs on a thread over urllib, with no coroutine hop per chunk; progress is posted back
+                loop = asyncio.get_running_loop()
+                stop = threading.Event()
+
+                def report(done: int, size: int):
+                    if not stop.is_set():
+                        asyncio.run_coroutine_threadsafe(
+                            progress_tracker.update_progress(done, size or done, stage="Downloading"), loop
+                        )
+
+                transfer = asyncio.ensure_future(
+                    asyncio.to_thread(urllib_download, final_url, filename, headers, total_size, report, stop)
+                )
+                try:
+                    await asyncio.shield(transfer)
+                except asyncio.CancelledError:
+                    # Lost a race or the user went away: stop the thread and wait for it to let go of the file,
+                    # so nothing is still writing (or posting progress) once the caller removes the temp dir
+                    stop.set()
+                    await asyncio.gather(transfer, return_exceptions=True)
+                    raise
+                except OSError as e:
+                    logger.warning(f"Direct download failed: {e}")
+                    return None, None
+
+            final_size = stat_size(filename)
+            if final_size:
 
-                async with client.stream('GET', url) as response:
-                    if response.status_code not in [200, 206]:
-                        logger.warning(f"Direct download returned status {response.status_code}")
+                # Enhanced compression for large files
+                if final_size > Config.MAX_FILE_SIZE:
+                    logger.info(f"File too large: {final_size/1024/1024:.1f} MB, using smart compression")
+                    compressed_file = await self._compress_video_smart(filename, progress_tracker)
+                    compressed_size = stat_size(compressed_file) if compressed_file else 0
+                    if compressed_size:
+                        if compressed_size <= Config.MAX_FILE_SIZE:
+                            logger.info(f"Smart compression: {final_size/1024/1024:.1f} MB → {compressed_size/1024/1024:.1f} MB")
+                            try:
+                                await aiofiles.os.remove(filename)
+                            except OSError:
+                                pass
+                            filename = compressed_file
+                        else:
+                            logger.warning(f"Compressed file still too large: {compressed_size/1024/1024:.1f} MB")
+                            return None, None
+                    else:
+                        logger.warning("Smart compression failed")
                         return None, None
 
-                    if total_size == 0:
-                        total_size = int(response.headers.get('content-length', 0))
-
-                    if total_size > 0:
-                        logger.info(f"Downloading direct file: {total_size/1024/1024:.1f} MB")
-
-                    downloaded = 0
-                    start_time = time.time()
-
-                    async with aopen(filename, 'wb') as f:
-                        async for chunk in response.aiter_bytes(chunk_size=1048576):  # 1MB chunks for faster downloads
-                            await f.write(chunk)
-                            downloaded += len(chunk)
-
-                            # Update progress more frequently
-                            await progress_tracker.update_progress(downloaded, total_size or downloaded, stage="Downloading")
-
-                    if os.path.exists(filename) and os.path.getsize(filename) > 0:
-                        final_size = os.path.getsize(filename)
-
-                        # Enhanced compression for large files
-                        if final_size > Config.MAX_FILE_SIZE:
-                            logger.info(f"File too large: {final_size/1024/1024:.1f} MB, using smart compression")
-                            compressed_file = await self._compress_video_smart(filename, progress_tracker)
-                            if compressed_file and os.path.exists(compressed_file):
-                                compressed_size = os.path.getsize(compressed_file)
-                                if compressed_size <= Config.MAX_FILE_SIZE:
-                                    logger.info(f"Smart compression: {final_size/1024/1024:.1f} MB → {compressed_size/1024/1024:.1f} MB")
-                                    try:
-                                        os.unlink(filename)
-                                    except:
-                                        pass
-                                    filename = compressed_file
-                                else:
-                                    logger.warning(f"Compressed file still too large: {compressed_size/1024/1024:.1f} MB")
-                                    return None, None
-                            else:
-                                logger.warning("Smart compression failed")
-                                return None, None
-
-                        return filename, metadata
+                return filename, metadata
 
         except asyncio.TimeoutError:
             logger.error("Enhanced direct download timed out")
@@ -2170,65 +2948,43 @@ class SocialMediaDownloader:
     async def download_m3u8_enhanced(self, url: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
         """Enhanced M3U8 download with better progress tracking"""
         try:
-            output_file = f"{self.temp_dir}/stream_{int(time.time())}.mp4"
+            output_file = self._temp_path("stream")
 
             await progress_tracker.update_compression_progress(
                 "M3U8 Stream Processing",
                 "Analyzing stream segments and quality..."
             )
 
-            def run_enhanced_m3u8_download():
-                import subprocess
-
-                # Enhanced yt-dlp command for M3U8
-                cmd = [
-                    'yt-dlp',
-                    '--format', 'best[height<=2160][ext=mp4]/best[height<=1440][ext=mp4]/best[height<=1080][ext=mp4]/best[height<=720][ext=mp4]/best[ext=mp4]/best',
-                    '--output', output_file,
-                    '--write-info-json',
-                    '--merge-output-format', 'mp4',
-                    '--prefer-ffmpeg',
-                    '--socket-timeout', '120',
-                    '--fragment-retries', '20',  # Increased retries for M3U8
-                    '--retries', '15',
-                    '--http-chunk-size', '52428800',  # 50MB chunks for much faster downloads
-                    '--progress',
-                    '--newline',
-                    '--concurrent-fragments', '16',  # Download 16 fragments concurrently for maximum speed
-                    url
-                ]
-
-                logger.info(f"Running enhanced M3U8 download: {' '.join(cmd)}")
-
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=900  # 15 minute timeout for M3U8
-                )
+            # Enhanced yt-dlp command for M3U8
+            cmd = [
+                'yt-dlp',
+                '--format', 'best[height<=2160][ext=mp4]/best[height<=1440][ext=mp4]/best[height<=1080][ext=mp4]/best[height<=720][ext=mp4]/best[ext=mp4]/best',
+                '--output', output_file,
+                '--write-info-json',
+                '--merge-output-format', 'mp4',
+                '--prefer-ffmpeg',
+                '--socket-timeout', '120',
+                '--fragment-retries', '20',  # Increased retries for M3U8
+                '--retries', '15',
+                '--concurrent-fragments', str(RANGE_DOWNLOAD_CONNECTIONS),  # Fetch HLS segments in parallel
+                '--http-chunk-size', '52428800',  # 50MB chunks for much faster downloads
+                *YTDLP_PROGRESS_ARGS,
+                url
+            ]
 
-                if result.returncode == 0:
-                    info_file = output_file.replace('.mp4', '.info.json')
-                    if os.path.exists(info_file):
-                        try:
-                            with open(info_file, 'r') as f:
-                                return json.load(f)
-                        except:
-                            pass
+            logger.info(f"Running enhanced M3U8 download: {' '.join(cmd)}")
 
-                    return {
-                        'title': 'M3U8 Stream',
-                        'description': 'Downloaded M3U8 stream',
-                        'platform': 'm3u8'
-                    }
-                else:
-                    logger.error(f"Enhanced M3U8 download failed: {result.stderr}")
-                    raise Exception(f"yt-dlp failed: {result.stderr}")
+            result = await run_ytdlp(cmd, timeout=900, progress_tracker=progress_tracker)  # 15 minute timeout for M3U8
+            if result.returncode != 0:
+                logger.error(f"Enhanced M3U8 download failed: {result.stderr}")
+                raise Exception(f"yt-dlp failed: {result.stderr}")
 
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
-                future = executor.submit(run_enhanced_m3u8_download)
-                info = future.result(timeout=960)
+            info = {}
+            try:
+                async with aiofiles.open(output_file.replace('.mp4', '.info.json'), 'rb') as f:
+                    info = orjson.loads(await f.read())
+            except (OSError, orjson.JSONDecodeError):
+                pass
 
             metadata = {
                 'title': info.get('title', 'M3U8 Stream'),
@@ -2237,20 +2993,20 @@ class SocialMediaDownloader:
                 'platform': 'm3u8'
             }
 
-            if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-                file_size = os.path.getsize(output_file)
+            file_size = stat_size(output_file)
+            if file_size:
 
                 # Enhanced compression for M3U8 files
                 if file_size > Config.MAX_FILE_SIZE:
                     logger.info(f"M3U8 file too large: {file_size/1024/1024:.1f} MB, using smart compression")
                     compressed_file = await self._compress_video_smart(output_file, progress_tracker)
-                    if compressed_file and os.path.exists(compressed_file):
-                        compressed_size = os.path.getsize(compressed_file)
+                    compressed_size = stat_size(compressed_file) if compressed_file else 0
+                    if compressed_size:
                         if compressed_size <= Config.MAX_FILE_SIZE:
                             logger.info(f"M3U8 smart compression: {file_size/1024/1024:.1f} MB → {compressed_size/1024/1024:.1f} MB")
                             try:
-                                os.unlink(output_file)
-                            except:
+                                await aiofiles.os.remove(output_file)
+                            except OSError:
                                 pass
                             output_file = compressed_file
                         else:
@@ -2267,94 +3023,9 @@ class SocialMediaDownloader:
 
         return None, None
 
-    async def download_video(self, url: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
-        """Enhanced main download method with better fallback system"""
-        platform = await self.get_platform(url)
-        logger.info(f"Detected platform: {platform} for URL: {url}")
-
-        # Special handling for m3u8
-        if platform == 'm3u8':
-            return await self.download_m3u8_enhanced(url, progress_tracker)
-
-        # Special handling for direct video URLs
-        if platform == 'direct':
-            logger.info("Direct video URL detected, downloading directly")
-            try:
-                metadata = {
-                    'title': url.split('/')[-1].split('?')[0],
-                    'description': 'Direct video download',
-                    'platform': 'direct'
-                }
-                return await self._download_direct_url_enhanced(url, progress_tracker, metadata)
-            except Exception as e:
-                logger.error(f"Enhanced direct download failed: {e}")
-                return None, None
-
-        # ULTRA SPEED: Try all methods in parallel for fastest possible download
-        import asyncio
-
-        async def try_yt_dlp():
-            try:
-                result = await self.download_with_yt_dlp(url, progress_tracker)
-                if result[0]:
-                    logger.info("✅ SPEED WIN: yt-dlp method succeeded first!")
-                    return result
-            except Exception as e:
-                logger.warning(f"yt-dlp method failed: {e}")
-            return None, None
-
-        async def try_api():
-            try:
-                result = await self.download_with_api(url, platform, progress_tracker)
-                if result[0]:
-                    logger.info("✅ SPEED WIN: API method succeeded first!")
-                    return result
-            except Exception as e:
-                logger.warning(f"API method failed: {e}")
-            return None, None
-
-        async def try_cookies():
-            try:
-                result = await self.download_with_cookies(url, platform, progress_tracker)
-                if result[0]:
-                    logger.info("✅ SPEED WIN: Cookie method succeeded first!")
-                    return result
-            except Exception as e:
-                logger.warning(f"Cookie method failed: {e}")
-            return None, None
-
-        # Run all methods simultaneously - first one to succeed wins!
-        logger.info("🚀 TURBO MODE: Running all download methods in parallel...")
-
-        tasks = [
-            asyncio.create_task(try_yt_dlp()),
-            asyncio.create_task(try_api()),
-            asyncio.create_task(try_cookies())
-        ]
-
-        # Wait for first successful result
-        for completed in asyncio.as_completed(tasks):
-            try:
-                result = await completed
-                if result[0]:  # If successful
-                    # Cancel remaining tasks to save resources
-                    for task in tasks:
-                        if not task.done():
-                            task.cancel()
-                    logger.info("🎯 PARALLEL DOWNLOAD SUCCESS!")
-                    return result
-            except Exception as e:
-                logger.warning(f"Parallel task failed: {e}")
-                continue
-
-        # If all parallel attempts failed
-        logger.error("❌ All parallel download methods failed")
-
-        return None, None
-
     async def download_video_with_quality(self, url: str, quality_format: str, quality_type: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
         """Download video with quality selection and smart priority system as requested by @Alcboss112"""
-        platform = await self.get_platform(url)
+        platform = self.get_platform(url)
         logger.info(f"Quality download - Platform: {platform}, Quality: {quality_type}, Format: {quality_format}")
 
         # Update progress tracker with priority system info
@@ -2381,6 +3052,19 @@ class SocialMediaDownloader:
             if result[0]:
                 return await self._apply_quality_conversion(result, quality_type, quality_format, progress_tracker)
 
+        # TikTok resolves fastest through its API, so skip the yt-dlp subprocess when it works
+        api_tried = platform == 'tiktok' and bool(Config.TIKTOK_API)
+        if api_tried:
+            try:
+                result = await self.download_with_api(url, platform, progress_tracker)
+                if result[0]:
+                    result = await self._apply_quality_conversion(result, quality_type, quality_format, progress_tracker)
+                    if result[0]:
+                        logger.info("✅ TikTok API download succeeded")
+                        return result
+            except Exception as e:
+                logger.warning(f"TikTok API shortcut failed: {e}")
+
         # Smart Priority System: packages → API → cookies
         # Priority 1: Package-based downloaders (yt-dlp, instaloader)
         logger.info("🔧 Priority 1: Trying package-based downloaders...")
@@ -2398,7 +3082,7 @@ class SocialMediaDownloader:
                     return result
 
             # Try yt-dlp with quality format
-            result = await self._download_with_ytdlp_quality(url, quality_format, quality_type, progress_tracker)
+            result = await self._download_with_ytdlp_quality(url, platform, quality_format, quality_type, progress_tracker)
             if result[0]:
                 logger.info("✅ Priority 1 SUCCESS: yt-dlp")
                 return result
@@ -2406,22 +3090,23 @@ class SocialMediaDownloader:
         except Exception as e:
             logger.warning(f"Priority 1 (packages) failed: {e}")
 
-        # Priority 2: API-based methods
-        logger.info("🔧 Priority 2: Trying API-based methods...")
-        await progress_tracker.update_compression_progress(
-            "Priority 2: APIs",
-            "Attempting platform-specific APIs with authentication..."
-        )
+        # Priority 2: API-based methods (already spent above for TikTok; asking again would only repeat the failure)
+        if not api_tried:
+            logger.info("🔧 Priority 2: Trying API-based methods...")
+            await progress_tracker.update_compression_progress(
+                "Priority 2: APIs",
+                "Attempting platform-specific APIs with authentication..."
+            )
 
-        try:
-            result = await self.download_with_api(url, platform, progress_tracker)
-            if result[0]:
-                result = await self._apply_quality_conversion(result, quality_type, quality_format, progress_tracker)
+            try:
+                result = await self.download_with_api(url, platform, progress_tracker)
                 if result[0]:
-                    logger.info("✅ Priority 2 SUCCESS: API method")
-                    return result
-        except Exception as e:
-            logger.warning(f"Priority 2 (APIs) failed: {e}")
+                    result = await self._apply_quality_conversion(result, quality_type, quality_format, progress_tracker)
+                    if result[0]:
+                        logger.info("✅ Priority 2 SUCCESS: API method")
+                        return result
+            except Exception as e:
+                logger.warning(f"Priority 2 (APIs) failed: {e}")
 
         # Priority 3: Cookie-based authentication
         logger.info("🔧 Priority 3: Trying cookie-based authentication...")
@@ -2459,8 +3144,8 @@ class SocialMediaDownloader:
             audio_file = await self._extract_audio_as_mp3(file_path, progress_tracker)
             if audio_file:
                 try:
-                    os.unlink(file_path)  # Remove original video
-                except:
+                    await aiofiles.os.remove(file_path)  # Remove original video
+                except OSError:
                     pass
 
                 # Update metadata for audio
@@ -2529,63 +3214,34 @@ class SocialMediaDownloader:
 
     def _sanitize_filename(self, filename: str) -> str:
         """Sanitize filename by removing invalid characters"""
-        import re
-        # Remove invalid characters for filenames
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-        filename = re.sub(r'\s+', '_', filename)  # Replace spaces with underscores
-        filename = filename.strip('._')  # Remove leading/trailing dots and underscores
+        # Drop invalid characters, turn whitespace runs into underscores, trim leading/trailing dots and underscores
+        filename = whitespace_regex.sub('_', filename.translate(_INVALID_FILENAME_CHARS)).strip('._')
         return filename if filename else "video"
 
     def _extract_filename_from_url(self, url: str) -> str:
         """Extract filename from URL"""
         try:
-            from urllib.parse import urlparse
             parsed = urlparse(url)
             filename = os.path.basename(parsed.path)
             return filename if filename else "direct_video"
-        except:
+        except ValueError:
             return "direct_video"
 
-    async def _download_with_ytdlp_quality(self, url: str, quality_format: str, quality_type: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
+    async def _download_with_ytdlp_quality(self, url: str, platform: str, quality_format: str, quality_type: str, progress_tracker: ProgressTracker) -> Tuple[Optional[str], Optional[Dict]]:
         """Download with yt-dlp using specific quality format"""
         try:
-            import subprocess
-            import json
-
             await progress_tracker.update_compression_progress(
                 "yt-dlp Quality Download",
                 f"Format: {quality_format}"
             )
 
-            # Get video info first
-            info_cmd = [
-                'yt-dlp', '--dump-json', '--no-download',
-                '--format', quality_format,
-                '--no-check-certificates', '--no-warnings',
-                url
-            ]
-
-            info_result = subprocess.run(info_cmd, capture_output=True, text=True, timeout=60, check=False)
-            if info_result.returncode != 0:
-                raise Exception(f"Info extraction failed: {info_result.stderr}")
-
-            # Parse video info
-            info = None
-            for line in info_result.stdout.strip().split('\n'):
-                if line.strip():
-                    try:
-                        info = json.loads(line)
-                        break
-                    except json.JSONDecodeError:
-                        continue
-
-            if not info:
-                raise Exception("No video info found")
+            # Title and description come from the probe cached when the link was first analysed, not a second extraction
+            info = await self._get_video_quality_info(url, platform) or {}
 
             # Generate enhanced filename template with title and description
             title = self._sanitize_filename(info.get('title', 'video'))[:50]
-            platform = await self.get_platform(url)
-            output_template = f'{self.temp_dir}/{title}_{platform}.%(ext)s'
+            dl_dir = self._download_dir()
+            output_template = f'{dl_dir}/{title}_{platform}.%(ext)s'
 
             # Download with specified quality - skip problematic flags for audio
             download_cmd = [
@@ -2600,21 +3256,20 @@ class SocialMediaDownloader:
 
             download_cmd.append(url)
 
-            result = subprocess.run(download_cmd, capture_output=True, text=True, timeout=300, check=False)
+            result = await run_process(download_cmd, timeout=300)
             if result.returncode != 0:
                 raise Exception(f"Download failed: {result.stderr}")
 
             # Find downloaded file
-            for file in Path(self.temp_dir).glob("*"):
-                if file.suffix in ['.mp4', '.mkv', '.webm', '.avi', '.mp3'] and file.stat().st_size > 0:
-                    metadata = {
-                        'title': info.get('title', 'Video'),
-                        'description': info.get('description', ''),
-                        'duration': info.get('duration'),
-                        'uploader': info.get('uploader', ''),
-                        'platform': platform
-                    }
-                    return str(file), metadata
+            for file, _ in iter_video_files(dl_dir, _MEDIA_EXTS):
+                metadata = {
+                    'title': info.get('title', 'Video'),
+                    'description': info.get('description', ''),
+                    'duration': info.get('duration'),
+                    'uploader': info.get('uploader', ''),
+                    'platform': platform
+                }
+                return str(file), metadata
 
             return None, None
 
@@ -2632,8 +3287,9 @@ class SocialMediaDownloader:
                 "Extracting Instagram content..."
             )
 
+            dl_dir = self._download_dir()
             L = instaloader.Instaloader(
-                dirname_pattern=self.temp_dir,
+                dirname_pattern=dl_dir,
                 filename_pattern='{title}_{shortcode}',
                 download_videos=True,
                 download_video_thumbnails=False,
@@ -2643,33 +3299,29 @@ class SocialMediaDownloader:
             )
 
             # Extract shortcode from URL
-            import re
-            shortcode_match = re.search(r'/p/([A-Za-z0-9_-]+)', url)
-            if not shortcode_match:
-                shortcode_match = re.search(r'/reel/([A-Za-z0-9_-]+)', url)
+            shortcode_match = instagram_shortcode_regex.search(url)
 
             if not shortcode_match:
                 raise Exception("Could not extract Instagram shortcode from URL")
 
             shortcode = shortcode_match.group(1)
-            post = instaloader.Post.from_shortcode(L.context, shortcode)
+            post = await run_blocking(instaloader.Post.from_shortcode, L.context, shortcode)
 
             # Download the post
-            L.download_post(post, target=self.temp_dir)
+            await run_blocking(L.download_post, post, target=dl_dir)
 
             # Find downloaded video file
-            for file in Path(self.temp_dir).glob("*"):
-                if file.suffix in ['.mp4', '.mov'] and file.stat().st_size > 0:
-                    metadata = {
-                        'title': post.caption[:100] if post.caption else f"Instagram_{shortcode}",
-                        'description': post.caption if post.caption else '',
-                        'uploader': post.owner_username,
-                        'platform': 'instagram',
-                        'upload_date': post.date.strftime('%Y%m%d'),
-                        'like_count': post.likes,
-                        'view_count': post.video_view_count if post.is_video else None
-                    }
-                    return str(file), metadata
+            for file, _ in iter_video_files(dl_dir, ('.mp4', '.mov')):
+                metadata = {
+                    'title': post.caption[:100] if post.caption else f"Instagram_{shortcode}",
+                    'description': post.caption if post.caption else '',
+                    'uploader': post.owner_username,
+                    'platform': 'instagram',
+                    'upload_date': post.date.strftime('%Y%m%d'),
+                    'like_count': post.likes,
+                    'view_count': post.video_view_count if post.is_video else None
+                }
+                return str(file), metadata
 
             return None, None
 
@@ -2680,8 +3332,6 @@ class SocialMediaDownloader:
     async def _extract_audio_as_mp3(self, video_path: str, progress_tracker: ProgressTracker) -> Optional[str]:
         """Extract audio from video as MP3"""
         try:
-            from moviepy.editor import VideoFileClip
-
             output_path = video_path.rsplit('.', 1)[0] + '.mp3'
 
             await progress_tracker.update_compression_progress(
@@ -2689,25 +3339,33 @@ class SocialMediaDownloader:
                 "Converting to MP3 format..."
             )
 
-            with VideoFileClip(video_path) as video:
-                audio = video.audio
-                if audio:
-                    audio.write_audiofile(
-                        output_path,
-                        verbose=False,
-                        logger=None,
-                        codec='mp3',
-                        bitrate='192k'
-                    )
-                    audio.close()
-                    return output_path
-
-            return None
+            # Demux the audio track and encode it alone; the video stream is never decoded
+            cmd = [*FFMPEG, '-i', video_path, '-vn', '-ac', '2', '-ar', '44100',
+                   '-codec:a', 'libmp3lame', '-b:a', '192k', '-y', output_path]
+            async with COMPRESS_SEM:
+                result = await run_process(cmd, timeout=300)
+            if result.returncode != 0:
+                # Also the outcome for a video without an audio track
+                logger.error(f"Audio extraction failed: {result.stderr}")
+                return None
+            return output_path
 
         except Exception as e:
             logger.error(f"Audio extraction failed: {e}")
             return None
 
+# Metadata probes never write downloads, so they share one long-lived downloader instead of a temp dir each
+_probe_downloader: Optional[SocialMediaDownloader] = None
+
+def get_probe_downloader() -> SocialMediaDownloader:
+    """Return the shared downloader used for platform detection and quality probes"""
+    global _probe_downloader
+    if _probe_downloader is None:
+        _probe_downloader = SocialMediaDownloader()
+        _probe_downloader.session = get_http_client()
+        atexit.register(shutil.rmtree, _probe_downloader.temp_dir, True)
+    return _probe_downloader
+
 class TelegramBot:
     """Enhanced Telegram bot with upload progress tracking"""
 
@@ -2800,7 +3458,7 @@ class TelegramBot:
                     caption=success_text,
 
                 )
-            except Exception:
+            except TelegramError:
                 await query.message.reply_text(
                     success_text,
 
@@ -2824,7 +3482,7 @@ class TelegramBot:
                     reply_markup=reply_markup,
 
                 )
-            except Exception:
+            except TelegramError:
                 await query.message.reply_text(
                     not_member_text,
                     reply_markup=reply_markup,
@@ -2835,7 +3493,7 @@ class TelegramBot:
         """Enhanced URL handler with quality selection as requested by @Alcboss112"""
         user = update.effective_user
         chat_id = update.effective_chat.id
-        message_text = update.message.text
+        url_text = (update.message.text or "").strip()
 
         # Check if user has joined channel
         if chat_id not in user_states or not user_states[chat_id].get("joined_channel", False):
@@ -2846,12 +3504,10 @@ class TelegramBot:
             return
 
         # Better URL validation and normalization
-        url_text = message_text.strip()
-
         # Handle partial URLs (like /eBl_3AB0lCs?si=kPFo3Lca0TVtP4_M)
         if url_text.startswith('/'):
             # Extract video ID from YouTube format
-            if re.match(r'^/[a-zA-Z0-9_-]{11}', url_text):  # YouTube video ID pattern
+            if youtube_id_path_regex.match(url_text):  # YouTube video ID pattern
                 video_id = url_text[1:].split('?')[0]
                 url_text = f"https://www.youtube.com/watch?v={video_id}"
             # Handle Twitter status URLs
@@ -2866,11 +3522,11 @@ class TelegramBot:
                 url_text = f"https://www.youtube.com/watch?v={video_id}"
 
         # Add https if missing
-        if not url_text.startswith(('http://', 'https://')):
-            if any(domain in url_text for domain in ['youtube.com', 'youtu.be', 'twitter.com', 'x.com', 'facebook.com', 'instagram.com', 'tiktok.com']):
+        if not url_scheme_regex.match(url_text):
+            if platform_for_host(url_text.split('/', 1)[0]):
                 url_text = f"https://{url_text}"
 
-        if not url_regex.match(url_text):
+        if not is_valid_url(url_text):
             await update.message.reply_text(
                 "❌ Please send a valid video URL!\n\n"
                 "Supported platforms:\n"
@@ -2888,15 +3544,14 @@ class TelegramBot:
         user_states[chat_id]["pending_url"] = url_text
 
         # Detect platform for quality options
-        async with SocialMediaDownloader() as downloader:
-            platform = await downloader.get_platform(url_text)
+        downloader = get_probe_downloader()
+        platform = downloader.get_platform(url_text)
 
         # Dynamic quality selection buttons based on actual available qualities
         keyboard = []
 
         # Get quality info to show only available qualities
-        async with SocialMediaDownloader() as temp_downloader:
-            quality_info = await temp_downloader._get_video_quality_info(url_text, platform)
+        quality_info = await downloader._get_video_quality_info(url_text, platform)
 
         available_qualities = []
         if quality_info and 'video_formats' in quality_info:
@@ -3042,31 +3697,12 @@ class TelegramBot:
 
         video_url = user_states[chat_id]["pending_url"]
 
-        # Enhanced quality mapping with proper format selection
-        quality_map = {
-            "4k": "best[height<=2160][ext=mp4]/bestvideo[height<=2160][ext=mp4]+bestaudio[ext=m4a]/best[height<=2160]",
-            "1440p": "best[height<=1440][ext=mp4]/bestvideo[height<=1440][ext=mp4]+bestaudio[ext=m4a]/best[height<=1440]",
-            "1080p": "best[height<=1080][ext=mp4]/bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080]",
-            "720p": "best[height<=720][ext=mp4]/bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/best[height<=720]",
-            "480p": "best[height<=480][ext=mp4]/bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/best[height<=480]",
-            "360p": "best[height<=360][ext=mp4]/bestvideo[height<=360][ext=mp4]+bestaudio[ext=m4a]/best[height<=360]",
-            "audio": "bestaudio[ext=m4a]/bestaudio[ext=mp3]/bestaudio/best"
-        }
-
-        quality_format = quality_map.get(quality_type, "best")
-        quality_name = {
-            "4k": "4K Ultra HD",
-            "1440p": "1440p QHD", 
-            "1080p": "1080p Full HD",
-            "720p": "720p HD",
-            "480p": "480p Standard",
-            "360p": "360p Compact",
-            "audio": "MP3 Audio Only"
-        }.get(quality_type, "Best Available")
+        quality_format = _QUALITY_MAP.get(quality_type, "best")
+        quality_name = _QUALITY_NAMES.get(quality_type, "Best Available")
 
         # Get video info first to show title and description
-        async with SocialMediaDownloader() as temp_downloader:
-            video_info = await temp_downloader._get_video_quality_info(video_url, await temp_downloader.get_platform(video_url))
+        probe_downloader = get_probe_downloader()
+        video_info = await probe_downloader._get_video_quality_info(video_url, probe_downloader.get_platform(video_url))
 
         # Send enhanced processing message with title and description
         processing_text = f"🔄 Processing Download...\n\n"
@@ -3102,15 +3738,25 @@ class TelegramBot:
             context.bot
         )
 
+        # Let the user know when their download is waiting for a free slot
+        if DOWNLOAD_SEMAPHORE.locked():
+            await query.edit_message_text(
+                processing_text.replace("Starting download...", "⏳ Queued, waiting for a free download slot...")
+            )
+
+        await DOWNLOAD_SEMAPHORE.acquire()
         try:
             # Download the video with smart priority system
             async with SocialMediaDownloader() as downloader:
-                file_path, metadata = await downloader.download_video_with_quality(
-                    video_url, 
-                    quality_format, 
-                    quality_type,
-                    progress_tracker
-                )
+                try:
+                    file_path, metadata = await downloader.download_video_with_quality(
+                        video_url, 
+                        quality_format, 
+                        quality_type,
+                        progress_tracker
+                    )
+                finally:
+                    await progress_tracker.aclose()
 
                 if not file_path or not os.path.exists(file_path):
                     await context.bot.edit_message_text(
@@ -3171,65 +3817,65 @@ class TelegramBot:
                 caption += f"⚡ **Enhanced Download by {Config.DEVELOPER_CREDIT}**\n\n🔗 **Source:** {video_url}"
 
                 # Send video with simplified upload 
-                with open(file_path, 'rb') as video_file:
-                    # Get safe duration value
-                    duration_value = None
-                    if metadata.get('duration'):
-                        try:
-                            duration_value = int(float(metadata['duration']))
-                        except (ValueError, TypeError, OverflowError):
-                            duration_value = None
+                video_file = await load_input_file(file_path)
+                # Get safe duration value
+                duration_value = None
+                if metadata.get('duration'):
+                    try:
+                        duration_value = int(float(metadata['duration']))
+                    except (ValueError, TypeError, OverflowError):
+                        duration_value = None
 
-                    # Send as audio or video based on format type
-                    if format_type == "mp3" or quality_type == "audio" or file_path.endswith(('.mp3', '.m4a', '.aac')):
-                        # Enhanced audio caption with metadata
-                        audio_caption = f"🎵 **{metadata.get('title', 'Audio Download')}**\n\n"
+                # Send as audio or video based on format type
+                if format_type == "mp3" or quality_type == "audio" or file_path.endswith(('.mp3', '.m4a', '.aac')):
+                    # Enhanced audio caption with metadata
+                    audio_caption = f"🎵 **{metadata.get('title', 'Audio Download')}**\n\n"
 
-                        if metadata.get('description'):
-                            desc = metadata['description'][:200] + "..." if len(metadata['description']) > 200 else metadata['description']
-                            audio_caption += f"📝 **Description:** {desc}\n\n"
+                    if metadata.get('description'):
+                        desc = metadata['description'][:200] + "..." if len(metadata['description']) > 200 else metadata['description']
+                        audio_caption += f"📝 **Description:** {desc}\n\n"
 
-                        if metadata.get('uploader'):
-                            audio_caption += f"👤 **Artist:** {metadata['uploader']}\n"
+                    if metadata.get('uploader'):
+                        audio_caption += f"👤 **Artist:** {metadata['uploader']}\n"
 
-                        if metadata.get('platform'):
-                            audio_caption += f"🌐 **Platform:** {metadata['platform'].title()}\n"
+                    if metadata.get('platform'):
+                        audio_caption += f"🌐 **Platform:** {metadata['platform'].title()}\n"
 
-                        # Safe duration formatting for audio
-                        if metadata.get('duration'):
-                            try:
-                                duration = metadata['duration']
-                                if isinstance(duration, (int, float)) and duration > 0:
-                                    duration_int = int(float(duration))
-                                    minutes = duration_int // 60
-                                    seconds = duration_int % 60
-                                    duration_str = f"{minutes}:{seconds:02d}"
-                                    audio_caption += f"⏱️ **Duration:** {duration_str}\n"
-                            except (ValueError, TypeError, OverflowError):
-                                pass
+                    # Safe duration formatting for audio
+                    if metadata.get('duration'):
+                        try:
+                            duration = metadata['duration']
+                            if isinstance(duration, (int, float)) and duration > 0:
+                                duration_int = int(float(duration))
+                                minutes = duration_int // 60
+                                seconds = duration_int % 60
+                                duration_str = f"{minutes}:{seconds:02d}"
+                                audio_caption += f"⏱️ **Duration:** {duration_str}\n"
+                        except (ValueError, TypeError, OverflowError):
+                            pass
 
-                        audio_caption += f"\n⚡ **Enhanced Download by {Config.DEVELOPER_CREDIT}**\n🔗 **Source:** {video_url}"
-
-                        await context.bot.send_audio(
-                            chat_id=chat_id,
-                            audio=video_file,
-                            caption=audio_caption,
-                            duration=duration_value,
-                            performer=metadata.get('uploader', 'Unknown Artist'),
-                            title=metadata.get('title', 'Audio Download'),
-                            read_timeout=300,
-                            write_timeout=300
-                        )
-                    else:
-                        await context.bot.send_video(
-                            chat_id=chat_id,
-                            video=video_file,
-                            caption=caption,
-                            supports_streaming=True,
-                            duration=duration_value,
-                            read_timeout=300,
-                            write_timeout=300
-                        )
+                    audio_caption += f"\n⚡ **Enhanced Download by {Config.DEVELOPER_CREDIT}**\n🔗 **Source:** {video_url}"
+
+                    sent_message = await context.bot.send_audio(
+                        chat_id=chat_id,
+                        audio=video_file,
+                        caption=audio_caption,
+                        duration=duration_value,
+                        performer=metadata.get('uploader', 'Unknown Artist'),
+                        title=metadata.get('title', 'Audio Download'),
+                        read_timeout=300,
+                        write_timeout=300
+                    )
+                else:
+                    sent_message = await context.bot.send_video(
+                        chat_id=chat_id,
+                        video=video_file,
+                        caption=caption,
+                        supports_streaming=True,
+                        duration=duration_value,
+                        read_timeout=300,
+                        write_timeout=300
+                    )
 
                 # Clear pending URL from user state
                 if "pending_url" in user_states[chat_id]:
@@ -3240,15 +3886,15 @@ class TelegramBot:
                 download_stats["total_downloads"] += 1
 
                 # Forward video to private channel
-                await self.forward_to_private_channel(user, video_url, metadata, chat_id, file_path)
+                await self.forward_to_private_channel(user, video_url, metadata, chat_id, file_path, sent_message)
 
                 # Log to private channel
                 await self.log_to_private_channel(user, video_url, metadata, chat_id)
 
                 # Cleanup file
                 try:
-                    os.unlink(file_path)
-                except Exception:
+                    await aiofiles.os.remove(file_path)
+                except OSError:
                     pass
 
         except Exception as e:
@@ -3266,6 +3912,8 @@ class TelegramBot:
             # Clear pending URL from user state
             if chat_id in user_states and "pending_url" in user_states[chat_id]:
                 del user_states[chat_id]["pending_url"]
+        finally:
+            DOWNLOAD_SEMAPHORE.release()
 
     async def notify_admin_new_user(self, user, total_users: int):
         """Notify admin about new user"""
@@ -3285,7 +3933,7 @@ class TelegramBot:
         except Exception as e:
             logger.error(f"Failed to notify admin: {e}")
 
-    async def forward_to_private_channel(self, user, video_url: str, metadata: Dict, chat_id: int, file_path: str):
+    async def forward_to_private_channel(self, user, video_url: str, metadata: Dict, chat_id: int, file_path: str, sent_message=None):
         """Forward downloaded video to private channel"""
         try:
             if not Config.TELEGRAM_CHANNEL_ID:
@@ -3300,16 +3948,26 @@ class TelegramBot:
             caption += f"🔗 **URL:** {video_url}\n"
             caption += f"🕒 **Time:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
 
-            # Send video to private channel
-            with open(file_path, 'rb') as video_file:
-                await self.bot.send_video(
+            # Copy the message the user already received; Telegram reuses the stored file, nothing is re-uploaded
+            if sent_message:
+                await self.bot.copy_message(
                     chat_id=Config.TELEGRAM_CHANNEL_ID,
-                    video=video_file,
-                    caption=caption,
-                    supports_streaming=True,
-                    read_timeout=600,
-                    write_timeout=600
+                    from_chat_id=chat_id,
+                    message_id=sent_message.message_id,
+                    caption=caption
                 )
+                return
+
+            # Send video to private channel
+            video_file = await load_input_file(file_path)
+            await self.bot.send_video(
+                chat_id=Config.TELEGRAM_CHANNEL_ID,
+                video=video_file,
+                caption=caption,
+                supports_streaming=True,
+                read_timeout=600,
+                write_timeout=600
+            )
 
         except Exception as e:
             logger.error(f"Failed to forward video to private channel: {e}")
@@ -3397,20 +4055,38 @@ class TelegramBot:
             try:
                 await asyncio.sleep(3600)  # Run every hour
 
-                # Clean up old temporary files
-                temp_base = tempfile.gettempdir()
-                cutoff_time = time.time() - (Config.AUTO_CLEANUP_HOURS * 3600)
+                # Clean up old temporary files; the directory walk and deletes run in a thread
+                def remove_stale_dirs():
+                    temp_base = TEMP_ROOT
+                    cutoff_time = time.time() - (Config.AUTO_CLEANUP_HOURS * 3600)
+
+                    for temp_dir in Path(temp_base).glob("telegram_bot_*"):
+                        if temp_dir.stat().st_mtime < cutoff_time:
+                            shutil.rmtree(temp_dir, ignore_errors=True)
+                            logger.info(f"Cleaned up old temp directory: {temp_dir}")
 
-                for temp_dir in Path(temp_base).glob("telegram_bot_*"):
-                    if temp_dir.stat().st_mtime < cutoff_time:
-                        shutil.rmtree(temp_dir, ignore_errors=True)
-                        logger.info(f"Cleaned up old temp directory: {temp_dir}")
+                await asyncio.to_thread(remove_stale_dirs)
 
             except Exception as e:
                 logger.error(f"Enhanced cleanup task error: {e}")
 
+    def build_application(self) -> Application:
+        """Create the PTB application and register every handler, shared by polling and webhook startup"""
+        self.application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+        self.bot = self.application.bot
+
+        self.application.add_handler(CommandHandler("start", self.start_command))
+        self.application.add_handler(CommandHandler("help", self.help_command))
+        self.application.add_handler(CommandHandler("stats", self.stats_command))
+        self.application.add_handler(CallbackQueryHandler(self.check_membership_callback, pattern="check_membership"))
+        self.application.add_handler(CallbackQueryHandler(self.handle_quality_selection, pattern="quality_"))
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_url))
+        return self.application
+
     async def run(self):
-        """Run the enhanced bot"""
+        """Run the enhanced bot until cancelled, polling or receiving webhooks"""
+        global bot_instance
+
         if not Config.TELEGRAM_BOT_TOKEN:
             logger.error("TELEGRAM_BOT_TOKEN not provided!")
             bot_status["running"] = False
@@ -3418,145 +4094,112 @@ class TelegramBot:
 
         try:
             # Create application
-            self.application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
-            self.bot = self.application.bot
-
-            # Update bot status
-            bot_status["running"] = True
-            bot_status["last_update"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
-            bot_status["bot_instance"] = self.bot
-
-            # Add handlers
-            self.application.add_handler(CommandHandler("start", self.start_command))
-            self.application.add_handler(CommandHandler("help", self.help_command))
-            self.application.add_handler(CommandHandler("stats", self.stats_command))
-            self.application.add_handler(CallbackQueryHandler(self.check_membership_callback, pattern="check_membership"))
-            self.application.add_handler(CallbackQueryHandler(self.handle_quality_selection, pattern="quality_"))
-            self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_url))
+            self.build_application()
 
             # Start enhanced cleanup task
-            asyncio.create_task(self.cleanup_task())
+            spawn(self.cleanup_task())
 
             # Start the enhanced bot
             logger.info("🚀 Enhanced Bot is starting...")
 
-            # Start polling with enhanced settings
-            await self.application.run_polling(
-                poll_interval=0.1,  # Ultra-fast polling for instant responsiveness
-                timeout=30,  # Higher timeout for heavy concurrent load
-                bootstrap_retries=10  # More retries for maximum reliability
-            )
+            # Drive PTB's lifecycle directly so it shares asyncio.run's loop with the web server
+            await self.application.initialize()
+            await self.application.start()
+
+            if Config.WEBHOOK_URL:
+                await self.bot.set_webhook(
+                    url=f"{Config.WEBHOOK_URL.rstrip('/')}/webhook",
+                    secret_token=Config.WEBHOOK_SECRET or None,
+                    allowed_updates=Update.ALL_TYPES
+                )
+                logger.info(f"✅ Enhanced Bot is running in webhook mode at {Config.WEBHOOK_URL}")
+            else:
+                # Start polling with enhanced settings
+                await self.application.updater.start_polling(
+                    poll_interval=0,  # Long polling already waits server-side, no extra sleep between calls
+                    timeout=Config.POLL_TIMEOUT,  # Block at Telegram until updates arrive
+                    bootstrap_retries=10,  # More retries for maximum reliability
+                    drop_pending_updates=True
+                )
+                logger.info("✅ Enhanced Bot is running!")
 
-            logger.info("✅ Enhanced Bot is running!")
+            # The /webhook route and web downloads reach the bot through these
+            bot_instance = self
+            bot_status["running"] = True
+            bot_status["last_update"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
+            bot_status["bot_instance"] = self.bot
 
         except Exception as e:
             logger.error(f"Bot run error: {e}")
             bot_status["running"] = False
             raise
 
-async def run_bot():
-    """Run the Telegram bot"""
-    bot = TelegramBot()
-    await bot.run()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            bot_status["running"] = False
+            if self.application.updater.running:
+                await self.application.updater.stop()
+            await self.application.stop()
+            await self.application.shutdown()
 
 async def main():
-    """Enhanced main function - runs both Flask server and Telegram bot"""
-    logger.info("🚀 Starting Social Media Downloader Bot with Flask server...")
+    """Enhanced main function - runs both the web server and Telegram bot on one event loop"""
+    logger.info("🚀 Starting Social Media Downloader Bot with web server...")
 
-    # Start Flask server in a separate thread
-    flask_thread = threading.Thread(target=run_flask_server, daemon=True)
-    flask_thread.start()
-    logger.info("🌐 Flask server thread started")
+    # Serve HTTP alongside the bot instead of in a separate thread
+    web_server = asyncio.create_task(run_web_server())
+    logger.info("🌐 Web server task started")
 
-    # Give Flask server a moment to start
-    await asyncio.sleep(2)
+    try:
+        # Run the Telegram bot on this loop (this will block)
+        if os.environ.get('DISABLE_BOT_STARTUP'):
+            logger.warning("⚠️ Bot startup disabled")
+        else:
+            await TelegramBot().run()
 
-    # Run the Telegram bot (this will block)
-    await run_bot()
+        # Keep serving the web interface if the bot stops or has no token
+        await web_server
+    finally:
+        # The web server keeps using the pooled client after the bot stops, so it closes only when both are done
+        await close_http_client()
 
 # Global bot instance for webhook mode
 bot_instance = None
 
 # Webhook route for Telegram
 @app.route(f'/webhook', methods=['POST'])
-def webhook():
+async def webhook():
     """Handle incoming Telegram webhooks"""
     try:
         if not bot_instance:
-            return jsonify({"error": "Bot not initialized"}), 500
+            return ojsonify({"error": "Bot not initialized"}), 500
+
+        if Config.WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != Config.WEBHOOK_SECRET:
+            return ojsonify({"error": "Forbidden"}), 403
 
         # Get the update from Telegram
-        update_dict = request.get_json()
+        update_dict = await read_json()
         if update_dict:
-            # Process the update asynchronously
             update = Update.de_json(update_dict, bot_instance.bot)
             if update:
-                # Process update in background thread
-                import asyncio
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(bot_instance.application.process_update(update))
+                if bot_instance.application.running:
+                    # Queue for the running application and acknowledge Telegram immediately
+                    await bot_instance.application.update_queue.put(update)
+                else:
+                    await bot_instance.application.process_update(update)
 
-        return jsonify({"status": "ok"})
+        return ojsonify({"status": "ok"})
     except Exception as e:
         logger.error(f"Webhook error: {e}")
-        return jsonify({"error": str(e)}), 500
-
-# Initialize bot for webhook mode
-def initialize_bot_webhook():
-    """Initialize bot for webhook mode"""
-    global bot_instance
-    try:
-        if not Config.TELEGRAM_BOT_TOKEN:
-            logger.error("❌ TELEGRAM_BOT_TOKEN not provided!")
-            bot_status["running"] = False
-            return
-
-        # Create bot instance
-        bot_instance = TelegramBot()
-        bot_instance.application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
-        bot_instance.bot = bot_instance.application.bot
-
-        # Add handlers
-        bot_instance.application.add_handler(CommandHandler("start", bot_instance.start_command))
-        bot_instance.application.add_handler(CommandHandler("help", bot_instance.help_command))
-        bot_instance.application.add_handler(CommandHandler("stats", bot_instance.stats_command))
-        bot_instance.application.add_handler(CallbackQueryHandler(bot_instance.check_membership_callback, pattern="check_membership"))
-        bot_instance.application.add_handler(CallbackQueryHandler(bot_instance.handle_quality_selection, pattern="quality_"))
-        bot_instance.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot_instance.handle_url))
-
-        # Initialize the application (async initialization)
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(bot_instance.application.initialize())
-
-        # Update status
-        bot_status["running"] = True
-        bot_status["last_update"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
-        bot_status["bot_instance"] = "webhook_mode"
-
-        logger.info("✅ Bot initialized in webhook mode")
-        return True
-
-    except Exception as e:
-        logger.error(f"❌ Bot webhook initialization error: {e}")
-        bot_status["running"] = False
-        return False
-
-# Initialize bot for production (webhook mode)
-if Config.TELEGRAM_BOT_TOKEN and not os.environ.get('DISABLE_BOT_STARTUP'):
-    if initialize_bot_webhook():
-        logger.info("🚀 Bot ready for webhook mode")
-    else:
-        logger.error("❌ Bot initialization failed")
-else:
-    logger.warning("⚠️ Bot startup disabled or no token found")
-    bot_status["running"] = False
+        return ojsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if uvloop:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Enhanced bot stopped by user")
         bot_status["running"] = False